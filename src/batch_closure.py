@@ -0,0 +1,264 @@
+import os
+import sys
+import time
+import argparse
+import logging
+from collections import namedtuple
+from concurrent.futures import (ProcessPoolExecutor, FIRST_COMPLETED,
+                                wait)
+
+from make_temp_rel_const_table import (DEFAULT_TRANSITIVE_TABLE, ENGINES,
+                                       ConstraintNetwork, Link, NodeRegistry,
+                                       TemporalRelation, TimeMLRelation,
+                                       getCompositionTable,
+                                       loadTransitiveConstraints)
+from timeml_loader import TIMEML_EXTENSIONS, loadTimeML
+
+# create logger
+module_logger = logging.getLogger('batch_closure')
+
+ClosureResult = namedtuple('ClosureResult',
+                           ['document', 'status', 'nodes', 'seconds',
+                            'error', 'network'])
+
+# the transitive constraints of a worker process, loaded once by
+# initWorker and shared by all documents the worker closes
+_workerConstraints = None
+
+
+def readTlinks(tlinkFile):
+    """
+    Read (source id, destination id, relation) triples from a TLINK
+    file with one 'source,destination,relations' line per link, where
+    relations are space separated symbols of transitive_table.txt or
+    TimeML relTypes
+    """
+
+    with open(tlinkFile, 'r') as inobj:
+        for line in inobj:
+
+            if not line.strip() or line.startswith('#'):
+                continue
+
+            source, destination, relations = line.rstrip().split(',')
+            relation = 0
+            for indRel in relations.split():
+                if indRel in TemporalRelation.RELATION_TO_BIT:
+                    relation |= TemporalRelation.RELATION_TO_BIT[indRel]
+                else:
+                    relation |= TimeMLRelation.TIMEML_TO_ALLEN[indRel]
+
+            yield source.strip(), destination.strip(), relation
+
+
+def networkFromTlinks(tlinks, constraints=None, storage='links',
+                      engine='python'):
+    """
+    Build a ConstraintNetwork from (source id, destination id,
+    relation) triples
+    """
+
+    network = ConstraintNetwork(constraints=constraints, storage=storage,
+                                engine=engine)
+    nodes = NodeRegistry()
+
+    for sourceID, destinationID, relation in tlinks:
+        link = Link(nodes.get(sourceID), nodes.get(destinationID))
+        link.relation = relation
+        network.add(link)
+
+    return network
+
+
+def loadDocument(document, constraints=None, storage='links',
+                 engine='python'):
+    """Build a ConstraintNetwork from a TimeML or TLINK file."""
+
+    if document.lower().endswith(TIMEML_EXTENSIONS):
+        return loadTimeML(document, ConstraintNetwork(
+            constraints=constraints, storage=storage, engine=engine))
+
+    return networkFromTlinks(readTlinks(document), constraints, storage,
+                             engine)
+
+
+def initWorker(transitive_table):
+
+    global _workerConstraints
+    _workerConstraints = loadTransitiveConstraints(transitive_table)
+    getCompositionTable(_workerConstraints)
+
+
+def closeDocument(name, document, storage='links', engine='python',
+                  returnNetwork=False):
+    """
+    Close one document, ConstraintNetwork or list of TLINK triples and
+    report its status
+    """
+
+    start = time.perf_counter()
+    network = None
+    error = None
+    try:
+        if isinstance(document, ConstraintNetwork):
+            network = document
+            returnNetwork = True
+        elif isinstance(document, (list, tuple)):
+            network = networkFromTlinks(document, _workerConstraints,
+                                        storage, engine)
+        else:
+            network = loadDocument(document, _workerConstraints, storage,
+                                   engine)
+
+        if network.isConsistent():
+            status = 'consistent'
+        else:
+            status = 'inconsistent'
+    except Exception as exc:
+        status = 'error'
+        error = '{}: {}'.format(type(exc).__name__, exc)
+
+    return ClosureResult(
+        name, status, len(network.nodes) if network is not None else 0,
+        time.perf_counter() - start, error,
+        network if returnNetwork else None)
+
+
+def closeDocuments(documents, transitive_table=None, maxWorkers=None,
+                   storage='links', engine='python', returnNetworks=False,
+                   maxPending=None):
+    """
+    Close many TimeML or TLINK files or ConstraintNetworks on a process
+    pool and yield a ClosureResult per document in completion order.
+
+    Every worker loads the transitive table and its composition table
+    once. At most maxPending documents (four per worker by default)
+    are submitted at a time so that large corpora are streamed rather
+    than queued up front. Results of files are named by path and those
+    of networks by their position in documents. Closed networks are
+    sent back for network inputs, and for files only when
+    returnNetworks is set.
+    """
+
+    if transitive_table is None:
+        transitive_table = DEFAULT_TRANSITIVE_TABLE
+
+    if maxWorkers is None:
+        maxWorkers = os.cpu_count() or 1
+    if maxPending is None:
+        maxPending = 4 * maxWorkers
+
+    documents = enumerate(documents)
+    pending = set()
+
+    with ProcessPoolExecutor(max_workers=maxWorkers,
+                             initializer=initWorker,
+                             initargs=(transitive_table,)) as executor:
+        while True:
+            for position, document in documents:
+                name = position if isinstance(
+                    document, ConstraintNetwork) else document
+                pending.add(executor.submit(closeDocument, name, document,
+                                            storage, engine, returnNetworks))
+                if len(pending) >= maxPending:
+                    break
+
+            if not pending:
+                return
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def closeComponents(network, transitive_table=None, maxWorkers=None):
+    """
+    Close the connected components of a ConstraintNetwork in parallel
+    with closeDocuments and write the narrowed relations back. Returns
+    whether the network is consistent.
+    """
+
+    if transitive_table is None:
+        transitive_table = network.transitive_table
+
+    components = network.components()
+    subNetworks = []
+    for members, pairs in components:
+        subNetwork = ConstraintNetwork(
+            constraints=network.constraintCalculator,
+            storage=network.storage, engine=network.engine)
+        for i in members:
+            subNetwork.addDefaultLinks(network.nodeList[i])
+            subNetwork.nodes.add(network.nodeList[i])
+
+        local = dict((i, n) for n, i in enumerate(members))
+        for i, j in pairs:
+            subNetwork.store.set(local[i], local[j], network.store.get(i, j))
+            subNetwork.store.set(local[j], local[i], network.store.get(j, i))
+        subNetworks.append(subNetwork)
+
+    consistent = True
+    set_ = network.store.set
+    for result in closeDocuments(subNetworks, transitive_table, maxWorkers,
+                                 network.storage, network.engine):
+        if result.status == 'error':
+            raise RuntimeError(result.error)
+        if result.status == 'inconsistent':
+            consistent = False
+
+        members = components[result.document][0]
+        for i, j, relation in result.network.store.relations():
+            set_(members[i], members[j], relation)
+
+    network.closed = consistent
+    network.touchedPairs = set()
+    network.version += 1
+    network.supportsIncomplete = True
+    return consistent
+
+
+def expandDocuments(paths):
+
+    for path in paths:
+        if os.path.isdir(path):
+            for fileName in sorted(os.listdir(path)):
+                filePath = os.path.join(path, fileName)
+                if os.path.isfile(filePath):
+                    yield filePath
+        else:
+            yield path
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(
+        description='Compute the temporal closure of TimeML or TLINK files')
+    parser.add_argument('documents', nargs='+',
+                        help='TimeML (.tml, .xml) or TLINK files, or '
+                        'directories of them')
+    parser.add_argument('--transitive-table', default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--storage', default='links',
+                        choices=['links', 'matrix', 'sparse'])
+    parser.add_argument('--engine', default='python',
+                        choices=ENGINES)
+    args = parser.parse_args(argv)
+
+    exitStatus = 0
+    for result in closeDocuments(expandDocuments(args.documents),
+                                 args.transitive_table, args.workers,
+                                 args.storage, args.engine):
+        fields = [str(result.document), result.status, str(result.nodes),
+                  '{:.6f}'.format(result.seconds)]
+        if result.error is not None:
+            fields.append(result.error)
+            exitStatus = 1
+        print('\t'.join(fields))
+        sys.stdout.flush()
+
+    return exitStatus
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
@@ -0,0 +1,231 @@
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import tracemalloc
+from collections import defaultdict
+
+from make_temp_rel_const_table import (DEFAULT_TRANSITIVE_TABLE, ENGINES,
+                                       CompositionTable, ConstraintNetwork,
+                                       Link, Node, TemporalRelation,
+                                       TransitiveConstraints, np)
+
+
+def randomLinks(numNodes, numLinks, seed, maxWidth=3, contradictions=0):
+    """
+    Random disjunctive links over numNodes nodes, each containing the
+    relation between random integer intervals, so that the links are
+    consistent unless contradictions of them are replaced by a
+    relation excluding the true one.
+    """
+
+    rand = random.Random(seed)
+    nodes = [Node(i) for i in range(numNodes)]
+    intervals = []
+    for _ in range(numNodes):
+        start = rand.randint(0, 3 * numNodes)
+        intervals.append((start, start + rand.randint(1, numNodes)))
+
+    basicRels = [1 << p for p in range(13)]
+    links = []
+    for n in range(numLinks):
+        i, j = rand.sample(range(numNodes), 2)
+        trueRel = TemporalRelation.intervalRelation(intervals[i],
+                                                    intervals[j])
+        relationSet = set(rand.sample(basicRels, rand.randint(1, maxWidth)))
+        if n < contradictions:
+            relationSet.discard(trueRel)
+            if not relationSet:
+                relationSet.add(trueRel << 1 if trueRel <
+                                TemporalRelation.EQUAL else 1)
+        else:
+            relationSet.add(trueRel)
+        links.append(Link(nodes[i], nodes[j], relationSet))
+
+    rand.shuffle(links)
+    return nodes, links
+
+
+def timeIt(function, repeat=1):
+    """Best wall time of repeat calls and the last return value."""
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best:
+            best = seconds
+    return best, result
+
+
+def peakMemory(function):
+    """Peak bytes allocated by Python while running function."""
+
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def buildNetwork(links, constraints, storage, engine):
+
+    network = ConstraintNetwork(constraints=constraints, storage=storage,
+                                engine=engine)
+    for link in links:
+        network.add(link)
+    return network
+
+
+def runBenchmarks(sizes, density=0.05, maxWidth=3, contradictions=0,
+                  storages=('links',), engines=('python',), seed=0,
+                  repeat=1, compositions=100000, memory=True,
+                  transitive_table=DEFAULT_TRANSITIVE_TABLE):
+    """
+    Run the benchmark suite and yield one dict per measurement.
+
+    Every size gets a synthetic network of density * n * (n - 1) / 2
+    links drawn from random intervals with up to maxWidth basic
+    relations each, the first contradictions of which exclude the
+    true relation. A final 'scaling' record per timed series gives the
+    exponent of a log-log fit of seconds against the number of nodes.
+    """
+
+    seconds, constraints = timeIt(
+        lambda: TransitiveConstraints(transitive_table), repeat)
+    yield {'benchmark': 'loadTransitiveConstraints', 'seconds': seconds}
+
+    seconds, table = timeIt(
+        lambda: CompositionTable(constraints.basicConstraints), repeat)
+    yield {'benchmark': 'buildCompositionTable', 'seconds': seconds,
+           'bytes': (len(table.low) + len(table.high)) *
+           table.low.itemsize}
+
+    rand = random.Random(seed)
+    pairs = [(rand.randint(1, TemporalRelation.ALL),
+              rand.randint(1, TemporalRelation.ALL))
+             for _ in range(compositions)]
+    network = ConstraintNetwork(constraints=constraints)
+    # build the shared table first, so that only compositions are timed
+    network.compositionTable
+    calConstraint = network.calConstraint
+
+    def compose():
+        for rel1, rel2 in pairs:
+            calConstraint(rel1, rel2)
+
+    seconds, _ = timeIt(compose, repeat)
+    yield {'benchmark': 'calConstraint', 'compositions': compositions,
+           'seconds': seconds, 'throughput': compositions / seconds}
+
+    series = defaultdict(list)
+
+    for size in sizes:
+        numLinks = max(1, int(density * size * (size - 1) / 2))
+        nodes, links = randomLinks(size, numLinks, seed + size, maxWidth,
+                                   contradictions)
+        common = {'nodes': size, 'links': numLinks}
+
+        seconds, _ = timeIt(
+            lambda: ConstraintNetwork(constraints=constraints).makePairs(
+                nodes), repeat)
+        series['makePairs'].append((size, seconds))
+        yield dict(common, benchmark='makePairs', seconds=seconds)
+
+        for storage in storages:
+            for engine in engines:
+                name = '{}/{}'.format(storage, engine)
+
+                seconds, _ = timeIt(
+                    lambda: buildNetwork(links, constraints, storage,
+                                         engine), repeat)
+                series['add/' + name].append((size, seconds))
+                yield dict(common, benchmark='add', storage=storage,
+                           engine=engine, seconds=seconds,
+                           throughput=numLinks / seconds)
+
+                best = None
+                for _ in range(repeat):
+                    network = buildNetwork(links, constraints, storage,
+                                           engine)
+                    seconds, consistent = timeIt(network.isConsistent)
+                    best = seconds if best is None else min(best, seconds)
+                series['isConsistent/' + name].append((size, best))
+
+                record = dict(common, benchmark='isConsistent',
+                              storage=storage, engine=engine, seconds=best,
+                              consistent=consistent)
+                if memory:
+                    record['peakBytes'] = peakMemory(
+                        lambda: buildNetwork(links, constraints, storage,
+                                             engine).isConsistent())
+                yield record
+
+    for name, points in sorted(series.items()):
+        points = [(n, seconds) for n, seconds in points if seconds > 0]
+        if len(points) < 2:
+            continue
+        xs = [math.log(n) for n, _ in points]
+        ys = [math.log(seconds) for _, seconds in points]
+        meanX = sum(xs) / len(xs)
+        meanY = sum(ys) / len(ys)
+        spread = sum((x - meanX) ** 2 for x in xs)
+        if spread == 0:
+            continue
+        exponent = sum((x - meanX) * (y - meanY)
+                       for x, y in zip(xs, ys)) / spread
+        yield {'benchmark': 'scaling', 'series': name,
+               'exponent': exponent, 'points': points}
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark composition, closure and scaling, '
+        'writing one JSON record per line')
+    parser.add_argument('--nodes', type=int, nargs='+',
+                        default=[25, 50, 100])
+    parser.add_argument('--density', type=float, default=0.05,
+                        help='fraction of node pairs with a link')
+    parser.add_argument('--max-width', type=int, default=3,
+                        help='maximum number of basic relations per link')
+    parser.add_argument('--contradictions', type=int, default=0,
+                        help='number of links excluding the true relation')
+    parser.add_argument('--storage', nargs='+', default=['links'],
+                        choices=['links', 'matrix', 'sparse'])
+    parser.add_argument('--engine', nargs='+', default=['python'],
+                        choices=ENGINES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--compositions', type=int, default=100000)
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip the traced peak memory runs')
+    parser.add_argument('--transitive-table',
+                        default=DEFAULT_TRANSITIVE_TABLE)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+
+    if 'numpy' in args.engine and np is None:
+        parser.error('the numpy engine requires NumPy')
+
+    outobj = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for record in runBenchmarks(
+                args.nodes, args.density, args.max_width,
+                args.contradictions, args.storage, args.engine, args.seed,
+                args.repeat, args.compositions, not args.no_memory,
+                args.transitive_table):
+            outobj.write(json.dumps(record, sort_keys=True) + '\n')
+            outobj.flush()
+    finally:
+        if outobj is not sys.stdout:
+            outobj.close()
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,115 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from make_temp_rel_const_table import DEFAULT_TRANSITIVE_TABLE
+from batch_closure import closeDocument, initWorker
+
+# create logger
+module_logger = logging.getLogger('closure_service')
+
+# returned by _nextDocument when the documents are exhausted, since a
+# task cannot end with StopAsyncIteration
+_END = object()
+
+
+async def _nextDocument(documents):
+
+    try:
+        return await documents.__anext__()
+    except StopAsyncIteration:
+        return _END
+
+
+async def _iterate(documents):
+
+    for document in documents:
+        yield document
+
+
+async def closeStream(documents, executor=None, maxWorkers=None,
+                      maxInFlight=None, storage='links', engine='python',
+                      returnNetworks=False, transitive_table=None):
+    """
+    Close the documents of an async (or plain) iterator on an executor
+    and yield a batch_closure.ClosureResult per document as soon as it
+    is closed.
+
+    A document is a TimeML or TLINK file path, a ConstraintNetwork or a
+    (name, TLINK triples) tuple, where the triples are (source id,
+    destination id, relation); networks are named by their position.
+    At most maxInFlight documents (two per worker by default) are
+    closing at once, and no further document is taken from documents
+    until one finishes, so a fast producer is held back instead of
+    queueing up. Results come back in completion order, so slow
+    documents do not delay the others.
+
+    Without an executor, a process pool of maxWorkers workers that
+    load transitive_table once is started and shut down with the
+    stream.
+    """
+
+    loop = asyncio.get_running_loop()
+    ownExecutor = executor is None
+    if ownExecutor:
+        executor = ProcessPoolExecutor(
+            max_workers=maxWorkers, initializer=initWorker,
+            initargs=(transitive_table or DEFAULT_TRANSITIVE_TABLE,))
+    if maxInFlight is None:
+        maxInFlight = 2 * (maxWorkers or os.cpu_count() or 1)
+
+    if hasattr(documents, '__aiter__'):
+        documents = documents.__aiter__()
+    else:
+        documents = _iterate(documents)
+
+    position = 0
+    pending = set()
+    fetch = None
+    exhausted = False
+
+    try:
+        while True:
+            if fetch is None and not exhausted and \
+                    len(pending) < maxInFlight:
+                fetch = asyncio.ensure_future(_nextDocument(documents))
+
+            waiting = set(pending)
+            if fetch is not None:
+                waiting.add(fetch)
+            if not waiting:
+                return
+
+            done, _ = await asyncio.wait(
+                waiting, return_when=asyncio.FIRST_COMPLETED)
+
+            if fetch in done:
+                document = fetch.result()
+                fetch = None
+                if document is _END:
+                    exhausted = True
+                else:
+                    if isinstance(document, tuple):
+                        name, document = document
+                        document = list(document)
+                    elif isinstance(document, str):
+                        name = document
+                    else:
+                        name = position
+                    position += 1
+                    pending.add(loop.run_in_executor(
+                        executor, closeDocument, name, document, storage,
+                        engine, returnNetworks))
+
+            for future in done & pending:
+                pending.discard(future)
+                yield future.result()
+
+    finally:
+        if fetch is not None:
+            fetch.cancel()
+        for future in pending:
+            future.cancel()
+        if ownExecutor:
+            executor.shutdown(wait=not pending, cancel_futures=True)
@@ -1,55 +1,209 @@
 import re
 import os
-import random
-from collections import defaultdict
+import sys
+import json
+import time
+import heapq
+import struct
+import threading
+import operator
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from array import array
+from collections import defaultdict, deque
 # from itertools import chain
 import logging
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # create logger
 module_logger = logging.getLogger('make_temp_rel_const_table')
 
+DEFAULT_TRANSITIVE_TABLE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+    'data/transitive_table.txt')
+
+
+# the table files of the calculi shipped in data/
+CALCULI = dict(
+    (name, os.path.join(os.path.dirname(DEFAULT_TRANSITIVE_TABLE),
+                        fileName))
+    for name, fileName in (('allen', 'transitive_table.txt'),
+                           ('point', 'point_algebra_table.txt'),
+                           ('rcc8', 'rcc8_table.txt'),
+                           ('timeml', 'timeml_table.txt')))
+
 
 class Node:
 
-    """A class that stores node information."""
+    """
+    A class that stores node information.
+
+    Nodes hash by identity; index is the dense id given by a
+    NodeRegistry, and nodeID defaults to a sequential 'node-<n>'.
+    """
+
+    __slots__ = ('nodeID', 'index')
+
+    logger = logging.getLogger('Node')
+    _defaultIDs = itertools.count()
 
-    def __init__(self, nodeID=None):
+    def __init__(self, nodeID=None, index=None):
 
-        self.logger = logging.getLogger('Node')
         if nodeID is None:
-            self.nodeID = random.random()
+            self.nodeID = 'node-{}'.format(next(Node._defaultIDs))
         else:
             self.nodeID = nodeID
+        self.index = index
+
+
+class NodeRegistry:
+
+    """
+    Interns one Node per external id (TimeML eid or tid, number), with
+    dense indices in order of first sighting
+    """
+
+    def __init__(self, nodeIDs=()):
+
+        self.nodeList = []
+        self.nodeByID = {}
+        for nodeID in nodeIDs:
+            self.get(nodeID)
+
+    def get(self, nodeID):
+        """The Node of nodeID, created on its first sighting"""
+
+        node = self.nodeByID.get(nodeID)
+        if node is None:
+            node = Node(nodeID, len(self.nodeList))
+            self.nodeByID[nodeID] = node
+            self.nodeList.append(node)
+        return node
+
+    __getitem__ = get
+
+    def __contains__(self, nodeID):
+
+        return nodeID in self.nodeByID
+
+    def __iter__(self):
+
+        return iter(self.nodeList)
+
+    def __len__(self):
+
+        return len(self.nodeList)
 
 
 class ConstraintNetwork:
 
-    def __init__(self, transitive_table=None, constraints=None):
+    def __init__(self, transitive_table=None, constraints=None,
+                 cacheFile=None, storage='links', incremental=False,
+                 engine='python', profile=False, calculus=None,
+                 maxWorkers=None, explain=False):
 
-        cwd = os.path.dirname(os.path.realpath(__file__))
-        parentDir = os.path.dirname(cwd)
+        if calculus is not None:
+            if calculus not in CALCULI:
+                raise ValueError('Undefined calculus: {}'.format(calculus))
+            transitive_table = CALCULI[calculus]
 
-        if transitive_table is None:
-            self.transitive_table = \
-                os.path.join(parentDir, 'data/transitive_table.txt')
+        if constraints is not None:
+            self.transitive_table = constraints.transitive_table
+        elif transitive_table is None:
+            self.transitive_table = DEFAULT_TRANSITIVE_TABLE
         else:
             self.transitive_table = transitive_table
 
         self.logger = logging.getLogger('ConstraintNetwork')
         self.nodes = set()
         self.constraints = set()
-        self.networkDict = defaultdict(dict)
+        self.nodeList = []
+        self.nodeIndex = {}
+        if storage not in RELATION_STORES:
+            raise ValueError('Undefined storage: {}'.format(storage))
+        self.storage = storage
+        if engine not in ENGINES:
+            raise ValueError('Undefined engine: {}'.format(engine))
+        if engine == 'numpy' and np is None:
+            raise ImportError('The numpy engine requires NumPy')
+        self.engine = engine
+        # the thread count of the 'threads' engine
+        self.maxWorkers = maxWorkers
         if constraints is None:
             self.constraintCalculator = \
-                TransitiveConstraints(self.transitive_table)
+                loadTransitiveConstraints(self.transitive_table)
         else:
             self.constraintCalculator = constraints
+        self.universal = self.constraintCalculator.universal
+        self.identity = self.constraintCalculator.identity
+        self.store = RELATION_STORES[storage](self.nodeList, self.nodeIndex,
+                                              self.universal)
+        self.networkDict = self.store.networkDict
+        self.cacheFile = cacheFile
+        self._compositionTable = None
+        self.touchedPairs = set()
+        # in incremental mode every add keeps the network closed and
+        # rejects (undoes) links that make it inconsistent
+        self.incremental = incremental
+        self.closed = incremental
+        # bumped whenever add narrows a relation, so that relation and
+        # relations know when their memoized answers are stale
+        self.version = 0
+        self._answers = {}
+        self._answersVersion = None
+        self._answersConsistent = True
+        self.stats = PropagationStats() if profile else None
+        # the links held by the network, as (link id, link) lists per
+        # (i, j) pair with i < j, for remove
+        self.linksByPair = defaultdict(list)
+        self.linkCount = 0
+        # with explain, the added links and, per (i, j) pair with i < j,
+        # the bitset of the links that narrowed it, so that failures
+        # can be traced back to the links involved in self.conflict
+        self.inputLinks = [] if explain else None
+        self.supports = {} if explain else None
+        self.conflict = None
+        # the bits of the links rejected by incremental adds, which are
+        # left in the supports but are not in the network
+        self.rejectedLinks = 0
+        # set once relations were narrowed other than by add and
+        # propagate, so that supports no longer cover every narrowing
+        self.supportsIncomplete = False
+
+    def __getstate__(self):
+
+        # the composition table is shared per process, not pickled
+        state = self.__dict__.copy()
+        state['_compositionTable'] = None
+        return state
+
+    @property
+    def converse(self):
+        """The converse of every relation of the network's calculus"""
+
+        return self.constraintCalculator.converse
+
+    @property
+    def compositionTable(self):
+        """
+        The process-wide CompositionTable of this network's transitive
+        table, built on first use
+        """
+
+        if self._compositionTable is None:
+            self._compositionTable = getCompositionTable(
+                self.constraintCalculator, self.cacheFile)
+        return self._compositionTable
 
     def addDefaultLinks(self, node):
 
-        for existingNode in self.nodes:
-            self.networkDict[node][existingNode] = Link(node, existingNode)
-            self.networkDict[existingNode][node] = Link(existingNode, node)
+        self.nodeIndex[node] = len(self.nodeList)
+        self.nodeList.append(node)
+        self.store.addNode(node)
 
     def add(self, link):
 
@@ -62,34 +216,166 @@ class ConstraintNetwork:
             self.addDefaultLinks(link.destination)
             self.nodes.add(link.destination)
 
-        self.networkDict[link.source][link.destination].relation &= \
-            link.relation
+        source = self.nodeIndex[link.source]
+        destination = self.nodeIndex[link.destination]
+
+        # links default to the 13 Allen relations, wider than ALL of
+        # smaller calculi
+        linkRelation = link.relation & self.universal
+
+        existingRelation = self.store.get(source, destination)
+        relation = existingRelation & linkRelation
+        self.store.set(source, destination, relation)
+
+        existingInverseRelation = self.store.get(destination, source)
+        inverseRelation = existingInverseRelation & \
+            self.converse[linkRelation]
+        self.store.set(destination, source, inverseRelation)
+
+        changed = (relation != existingRelation or
+                   inverseRelation != existingInverseRelation)
+        if changed:
+            self.version += 1
+
+        linkID = self.linkCount
+        self.linkCount += 1
+        pair = (source, destination) if source < destination else \
+            (destination, source)
+
+        if self.supports is not None:
+            linkBit = 1 << linkID
+            self.inputLinks.append(link)
+            if changed:
+                self.supports[pair] = self.supports.get(pair, 0) | linkBit
+            if relation == 0 or inverseRelation == 0:
+                self.conflict = self.supports.get(pair, 0) | linkBit
+
+        if self.incremental:
+            trail = [(source, destination, existingRelation),
+                     (destination, source, existingInverseRelation)]
+            if (relation == 0 or inverseRelation == 0 or
+                    changed and not self.propagate([(source, destination)],
+                                                   trail)):
+                self.rollback(trail)
+                if self.supports is not None:
+                    self.conflict &= ~self.rejectedLinks
+                    self.rejectedLinks |= linkBit
+                return False
+            self.linksByPair[pair].append((linkID, link))
+            return True
 
-        self.networkDict[link.destination][link.source].relation &= \
-            TemporalRelation.inverse(link.relation)
+        self.linksByPair[pair].append((linkID, link))
+        if changed:
+            self.touchedPairs.add((source, destination))
 
-        if (int('0', 2) ==
-                self.networkDict[link.source][link.destination].relation):
+        if int('0', 2) == relation:
             return False
 
-        elif (int('0', 2) ==
-                self.networkDict[link.destination][link.source].relation):
+        elif int('0', 2) == inverseRelation:
             return False
 
         else:
 
             return True
 
+    def remove(self, link):
+        """
+        Retract a link given to add, as if the network had been built
+        without it.
+
+        Only the pairs whose relation may depend on the link are reset
+        to the links left on them: with explain=True those whose
+        support contains it, otherwise every constrained pair of its
+        component. A closed network is then closed again by propagate
+        from the pairs touching the reset ones; otherwise they are left
+        for the next closure. Relations narrowed other than by add and
+        propagate (numpy or threads closures, closeReduced, the Solver,
+        networkDict writes followed by invalidate or a full closure)
+        set supportsIncomplete, after which removals always reset the
+        component.
+        """
+
+        source = self.nodeIndex[link.source]
+        destination = self.nodeIndex[link.destination]
+        pair = (source, destination) if source < destination else \
+            (destination, source)
+
+        pairLinks = self.linksByPair.get(pair, [])
+        for n, (linkID, pairLink) in enumerate(pairLinks):
+            if pairLink is link:
+                break
+        else:
+            raise ValueError('The link is not in the network')
+        del pairLinks[n]
+        if not pairLinks:
+            del self.linksByPair[pair]
+
+        supports = self.supports
+        if supports is not None and not self.supportsIncomplete:
+            linkBit = 1 << linkID
+            resetPairs = [resetPair for resetPair, support in
+                          supports.items() if support & linkBit]
+        else:
+            resetPairs = [pair]
+            for members, componentPairs in self.components():
+                if pair in componentPairs:
+                    resetPairs = componentPairs
+                    break
+
+        if supports is not None:
+            for resetPair in resetPairs:
+                supports[resetPair] = 0
+                for pairLinkID, _ in self.linksByPair.get(resetPair, ()):
+                    supports[resetPair] |= 1 << pairLinkID
+            self.conflict = None
+
+        set_ = self.store.set
+        converse = self.converse
+        for i, j in resetPairs:
+            relation = self.universal
+            for _, pairLink in self.linksByPair.get((i, j), ()):
+                linkRelation = pairLink.relation & self.universal
+                if self.nodeIndex[pairLink.source] != i:
+                    linkRelation = converse[linkRelation]
+                relation &= linkRelation
+            set_(i, j, relation)
+            set_(j, i, converse[relation])
+        self.version += 1
+
+        if not resetPairs:
+            return
+
+        # the triangles without a reset pair are still closed, and
+        # every triangle narrowing a reset pair has one of its two
+        # other pairs touching the same nodes
+        get = self.store.get
+        neighbors = self.store.neighbors
+        universal = self.universal
+        seedPairs = []
+        for i in set(node for resetPair in resetPairs for node in resetPair):
+            seedPairs.extend((i, k) for k in neighbors(i, i)
+                             if k != i and get(i, k) != universal)
+
+        if self.closed:
+            self.closed = self.propagate(seedPairs)
+            self._recordClosure(self.closed)
+        else:
+            self.touchedPairs.update(seedPairs)
+
+    def rollback(self, trail):
+        """
+        Restore the relations recorded in a trail of (i, j, relation)
+        entries, newest first
+        """
+
+        set_ = self.store.set
+        for i, j, relation in reversed(trail):
+            set_(i, j, relation)
+
     def relIterator(self, relation):
 
-        goldRelations = [TemporalRelation.BEFORE, TemporalRelation.AFTER,
-                         TemporalRelation.DURING, TemporalRelation.DURING_BY,
-                         TemporalRelation.OVERLAP, TemporalRelation.OVERLAP_BY,
-                         TemporalRelation.MEETS, TemporalRelation.MEET_BY,
-                         TemporalRelation.STARTS, TemporalRelation.STARTED_BY,
-                         TemporalRelation.FINISHES,
-                         TemporalRelation.FINISHED_BY,
-                         TemporalRelation.EQUAL]
+        goldRelations = [1 << p for p in
+                         range(self.constraintCalculator.width)]
 
         for goldRel in goldRelations:
 
@@ -99,105 +385,743 @@ class ConstraintNetwork:
 
     def calConstraint(self, constraint_i, constraint_j):
 
-        new_rels = int('0', 2)
+        if self.stats is not None:
+            self.stats.compositions += 1
+        return self.compositionTable.compose(constraint_i, constraint_j)
 
-        for rel_i in self.relIterator(constraint_i):
+    def isConsistent(self, full=False):
+        """
+        This method runs path consistency algorithm
+        and return output of the algorithm
+
+        With the 'points' engine, networks whose relations are all
+        pointisable are decided by propagatePoints instead, which leaves
+        the relations unchanged.
+        """
+
+        if self.engine == 'points':
+            stats = self.stats
+            start = time.perf_counter() if stats is not None else None
+            pointisable = self.isPointisable()
+            if stats is not None:
+                start = stats.recordPhase('isPointisable', start)
+
+            if pointisable:
+                consistent = self.propagatePoints()
+                self._recordClosure(consistent)
+                if stats is not None:
+                    stats.calls += 1
+                    stats.recordPhase('propagatePoints', start)
+                    self.logger.info(stats.logLine())
+                return consistent
+
+        return self.close(full)
+
+    def close(self, full=False):
+        """
+        Narrow the network to its path consistent closure with the
+        numpy or threads engine or propagate, returning False when it
+        is inconsistent.
+
+        After a successful run only the pairs narrowed by add since then
+        are queued again; full=True queues every constrained pair, which
+        is needed after writing relations through networkDict directly.
+        Full runs close each of the components separately.
+        """
 
-            for rel_j in self.relIterator(constraint_j):
+        stats = self.stats
+        start = time.perf_counter() if stats is not None else None
+        if full:
+            self.supportsIncomplete = True
+
+        if self.engine == 'numpy':
+            phase = 'propagateMatrix'
+            if not self.closed or full or self.touchedPairs:
+                self.closed = self.propagateMatrix()
+        elif self.engine == 'threads':
+            phase = 'propagateThreads'
+            if self.closed and not full:
+                self.closed = self.propagateThreads(self.touchedPairs)
+            else:
+                self.closed = self.propagateThreads()
+        elif self.closed and not full:
+            phase = 'propagate'
+            self.closed = self.propagate(self.touchedPairs)
+        else:
+            phase = 'propagate'
+            components = self.components()
+            if stats is not None:
+                start = stats.recordPhase('components', start)
+            self.closed = all(self.propagate(pairs, members=members)
+                              for members, pairs in components)
+        self.touchedPairs = set()
+        self._recordClosure(self.closed)
+
+        if stats is not None:
+            stats.calls += 1
+            stats.recordPhase(phase, start)
+            self.logger.info(stats.logLine())
+        return self.closed
+
+    def _recordClosure(self, consistent):
+
+        if self.supports is None:
+            return
+        if consistent:
+            self.conflict = None
+        elif self.conflict is None:
+            # engines other than propagate do not track supports
+            self.conflict = (1 << len(self.inputLinks)) - 1 & \
+                ~self.rejectedLinks
+
+    def explain(self):
+        """
+        A minimal set of the added links that is inconsistent by itself,
+        for the last add or closure that failed since the last
+        successful closure, or None when there is none. The network
+        must have been created with explain=True.
+
+        The links that narrowed the relations involved in the failure
+        are minimized with quickXplain, checking every subset on a
+        small incremental network of its own links rather than closing
+        this network again. Once supportsIncomplete is set, all the
+        links of the network are candidates.
+        """
 
-                derivedRel = self.constraintCalculator.basicConstraints[
-                    rel_i][rel_j]
+        if self.supports is None:
+            raise ValueError('The network does not record justifications;'
+                             ' create it with explain=True')
+        if self.conflict is None:
+            return None
 
-                self.logger.debug(
-                    '{},{} => {}'.format(
-                        TemporalRelation.relationToString(rel_i),
-                        TemporalRelation.relationToString(rel_j),
-                        TemporalRelation.relationToString(derivedRel)))
+        conflict = self.conflict
+        if self.supportsIncomplete:
+            # the rejected link of an incremental add stays in conflict
+            conflict |= (1 << len(self.inputLinks)) - 1 & \
+                ~self.rejectedLinks
+        candidates = [link for n, link in enumerate(self.inputLinks)
+                      if conflict >> n & 1]
+        return quickXplain(candidates, self._linksConsistent)
 
-                new_rels |= derivedRel
+    def _linksConsistent(self, links):
 
-        return new_rels
+        network = ConstraintNetwork(constraints=self.constraintCalculator,
+                                    storage='sparse', incremental=True)
+        return all(network.add(link) for link in links)
 
-    def isConsistent(self):
+    def relation(self, source, destination):
         """
-        This method runs path consistency algorithm
-        and return output of the algorithm
+        The relation of source to destination in the closure of the
+        network, or 0 when the network is inconsistent
+        """
+
+        return self.relations([(source, destination)])[0]
+
+    def relations(self, pairs):
         """
+        The closed relations of a sequence of (source, destination)
+        node pairs, as a list.
 
-        nodePairQueue = self.makePairs(self.nodes)
+        The network is closed on the first query after add changed it,
+        and answers are memoized until the next change. Writes through
+        networkDict, store or rollback are not tracked and need
+        invalidate.
+        """
 
-        while len(nodePairQueue) > 0:
-            nodePair = nodePairQueue.pop(0)
-            nodeI = nodePair.pop()
-            nodeJ = nodePair.pop()
+        if self._answersVersion != self.version:
+            self._answers = {}
+            self._answersConsistent = self.close()
+            self._answersVersion = self.version
+
+        answers = self._answers
+        nodeIndex = self.nodeIndex
+        get = self.store.get
+        results = []
+
+        for pair in pairs:
+            relation = answers.get(pair)
+            if relation is None:
+                i = nodeIndex[pair[0]]
+                j = nodeIndex[pair[1]]
+                if not self._answersConsistent:
+                    relation = 0
+                elif i == j:
+                    relation = self.identity
+                else:
+                    relation = get(i, j)
+                answers[pair] = relation
+            results.append(relation)
+
+        return results
+
+    def invalidate(self):
+        """Make the next query close the network again."""
+
+        self.version += 1
+        self.closed = False
+        self.supportsIncomplete = True
+
+    def closeReduced(self, projection=None, lift=True):
+        """
+        Approximate closure in a coarser calculus, by default the six
+        TimeML relations of timeMLProjection.
+
+        Every relation is projected onto the coarse calculus and the
+        projected network is closed there with its smaller table.
+        Returns False when the projection, and so the network, is
+        inconsistent. With lift, the closed coarse relations are lifted
+        back to narrow the relations of this network, which is left
+        for the exact isConsistent to finish.
+        """
 
-            for nodeK in self.nodes:
+        if projection is None:
+            projection = timeMLProjection()
 
-                if nodeK == nodeI or nodeK == nodeJ:
-                    continue
+        reduced = ConstraintNetwork(constraints=projection.coarse,
+                                    storage=self.storage,
+                                    engine='python' if self.engine ==
+                                    'points' else self.engine)
+        for node in self.nodeList:
+            reduced.addDefaultLinks(node)
+            reduced.nodes.add(node)
 
-                constraint_k_i = self.networkDict[nodeK][nodeI].relation
-                constraint_i_j = self.networkDict[nodeI][nodeJ].relation
+        project = projection.project
+        set_ = reduced.store.set
+        for i, j, relation in self.store.relations():
+            set_(i, j, project(relation))
+
+        if not reduced.isConsistent():
+            return False
+
+        if lift:
+            get = self.store.get
+            for i, j, relation in reduced.store.relations():
+                existing = get(i, j)
+                lifted = existing & projection.lift(relation)
+                if lifted != existing:
+                    self.store.set(i, j, lifted)
+                    self.supportsIncomplete = True
+                    if i < j:
+                        self.touchedPairs.add((i, j))
+                        self.version += 1
+
+        return True
+
+    def components(self):
+        """
+        The connected components of the relations other than ALL, as
+        (node indices, constrained (i, j) pairs with i < j) tuples.
 
-                existingConstraint_k_j = self.networkDict[
-                    nodeK][nodeJ].relation
+        Since composing with ALL gives ALL, path consistency never
+        narrows a pair across components, and closing every component
+        on its own costs the sum of their cubes.
+        """
 
-                new_constraint_k_j = self.calConstraint(constraint_k_i,
-                                                        constraint_i_j)
-                self.networkDict[nodeK][nodeJ].relation = \
-                    TemporalRelation.intersect(
-                        self.networkDict[nodeK][nodeJ].relation,
-                        new_constraint_k_j)
+        parent = list(range(len(self.nodeList)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        pairs = set()
+        for i, j, relation in self.store.relations():
+            pairs.add((i, j) if i < j else (j, i))
+            rootI = find(i)
+            rootJ = find(j)
+            if rootI != rootJ:
+                parent[rootI] = rootJ
+
+        members = defaultdict(list)
+        componentPairs = defaultdict(list)
+        for i in range(len(self.nodeList)):
+            members[find(i)].append(i)
+        for i, j in sorted(pairs):
+            componentPairs[find(i)].append((i, j))
+
+        return [(members[root], componentPairs[root])
+                for root in sorted(componentPairs, key=lambda root:
+                                   members[root][0])]
+
+    def propagate(self, seedPairs, trail=None, members=None):
+        """
+        PC-2 style path consistency from the given (i, j) node index
+        pairs. Each unordered pair is at most once in the queue.
+        Returns False as soon as a relation becomes empty.
 
-                if self.networkDict[nodeK][nodeJ].relation == 0:
+        When a trail list is given, the previous relation of every pair
+        written is appended to it so that rollback can undo the run.
+        members restricts the third nodes to those of one component.
+        """
 
+        stats = self.stats
+        supports = self.supports
+        compose = self.compositionTable.compose
+        inverse = self.converse
+        get = self.store.get
+        set_ = self.store.set
+        neighbors = self.store.neighbors
+
+        def support(i, j):
+            return supports.get((i, j) if i < j else (j, i), 0)
+
+        queue = deque() if stats is None else _CountingQueue(stats)
+        queued = set()
+        for nodeI, nodeJ in seedPairs:
+            pair = (nodeI, nodeJ) if nodeI < nodeJ else (nodeJ, nodeI)
+            if pair not in queued:
+                # an empty seed is never composed when the pair has no
+                # third node, so it is checked here
+                if get(nodeI, nodeJ) == 0:
+                    if supports is not None:
+                        self.conflict = support(nodeI, nodeJ)
                     return False
+                queued.add(pair)
+                queue.append(pair)
+
+        if trail is not None:
+            storeSet = set_
 
-                if (existingConstraint_k_j !=
-                        self.networkDict[nodeK][nodeJ].relation):
-                    nodePairQueue.append(set([nodeK, nodeJ]))
-                    self.networkDict[nodeJ][nodeK].relation = \
-                        TemporalRelation.inverse(
-                            self.networkDict[nodeK][nodeJ].relation)
+            def set_(i, j, relation):
+                trail.append((i, j, get(i, j)))
+                storeSet(i, j, relation)
 
-                constraint_k_j = self.networkDict[nodeK][nodeJ].relation
-                constraint_j_i = self.networkDict[nodeJ][nodeI].relation
+        if stats is not None:
+            compose, set_ = stats.countingFunctions(compose, set_)
 
-                existingConstraint_k_i = self.networkDict[
-                    nodeK][nodeI].relation
+        while queue:
+            pair = queue.popleft()
+            queued.discard(pair)
+            nodeI, nodeJ = pair
+
+            for nodeK in neighbors(nodeI, nodeJ, members):
+
+                if nodeK == nodeI or nodeK == nodeJ:
+                    continue
 
-                new_constraint_k_i = self.calConstraint(constraint_k_j,
-                                                        constraint_j_i)
+                existingConstraint_k_j = get(nodeK, nodeJ)
+                constraint_k_j = existingConstraint_k_j & compose(
+                    get(nodeK, nodeI), get(nodeI, nodeJ))
 
-                self.networkDict[nodeK][nodeI].relation = \
-                    TemporalRelation.intersect(
-                        self.networkDict[nodeK][nodeI].relation,
-                        new_constraint_k_i)
+                if constraint_k_j == 0:
 
-                if self.networkDict[nodeK][nodeI].relation == 0:
+                    if supports is not None:
+                        self.conflict = (support(nodeK, nodeI) |
+                                         support(nodeI, nodeJ) |
+                                         support(nodeK, nodeJ))
+                    return False
 
+                if existingConstraint_k_j != constraint_k_j:
+                    set_(nodeK, nodeJ, constraint_k_j)
+                    set_(nodeJ, nodeK, inverse[constraint_k_j])
+                    pair = (nodeK, nodeJ) if nodeK < nodeJ else \
+                        (nodeJ, nodeK)
+                    if supports is not None:
+                        supports[pair] = (supports.get(pair, 0) |
+                                          support(nodeK, nodeI) |
+                                          support(nodeI, nodeJ))
+                    if pair not in queued:
+                        queued.add(pair)
+                        queue.append(pair)
+
+                existingConstraint_k_i = get(nodeK, nodeI)
+                constraint_k_i = existingConstraint_k_i & compose(
+                    constraint_k_j, get(nodeJ, nodeI))
+
+                if constraint_k_i == 0:
+
+                    if supports is not None:
+                        self.conflict = (support(nodeK, nodeJ) |
+                                         support(nodeJ, nodeI) |
+                                         support(nodeK, nodeI))
                     return False
 
-                if (existingConstraint_k_i !=
-                        self.networkDict[nodeK][nodeI].relation):
-                    nodePairQueue.append(set([nodeK, nodeI]))
-                    self.networkDict[nodeI][nodeK].relation = \
-                        TemporalRelation.inverse(
-                            self.networkDict[nodeK][nodeI].relation)
+                if existingConstraint_k_i != constraint_k_i:
+                    set_(nodeK, nodeI, constraint_k_i)
+                    set_(nodeI, nodeK, inverse[constraint_k_i])
+                    pair = (nodeK, nodeI) if nodeK < nodeI else \
+                        (nodeI, nodeK)
+                    if supports is not None:
+                        supports[pair] = (supports.get(pair, 0) |
+                                          support(nodeK, nodeJ) |
+                                          support(nodeJ, nodeI))
+                    if pair not in queued:
+                        queued.add(pair)
+                        queue.append(pair)
 
         return True
 
+    def propagateMatrix(self):
+        """
+        Path consistency over the whole relation matrix with NumPy.
+
+        Every sweep narrows, for each node k at once, all relations
+        (i, j) with the composition of (i, k) and (k, j), until a sweep
+        changes nothing. Rows and columns that are ALL at k are skipped
+        since composing with ALL gives ALL. The fixpoint is the same as
+        the one reached by propagate.
+        """
+
+        self.supportsIncomplete = True
+
+        size = len(self.nodeList)
+        universal = self.universal
+        original = np.full((size, size), universal, dtype=np.uint16)
+        for i, j, relation in self.store.relations():
+            original[i, j] = relation
+        original[np.diag_indices(size)] = self.identity
+
+        matrix = original.copy()
+        table = self.compositionTable
+        low, high = table.numpyTables()
+        lowMask = np.uint16(table.lowMask)
+        lowBits = np.uint16(table.lowBits)
+
+        consistent = bool(matrix.all())
+        changed = consistent
+        while changed:
+            changed = False
+
+            for k in range(size):
+
+                rows = np.flatnonzero(matrix[:, k] != universal)
+                cols = np.flatnonzero(matrix[k] != universal)
+                if rows.size <= 1 or cols.size <= 1:
+                    continue
+
+                rel1 = matrix[rows, k][:, None]
+                rel2 = matrix[k, cols][None, :]
+                derived = low[rel1 & lowMask, rel2] | high[rel1 >> lowBits,
+                                                           rel2]
+                if self.stats is not None:
+                    self.stats.compositions += derived.size
+
+                block = np.ix_(rows, cols)
+                existing = matrix[block]
+                narrowed = existing & derived
+                if (narrowed != existing).any():
+                    matrix[block] = narrowed
+                    changed = True
+                    if not narrowed.all():
+                        consistent = False
+                        break
+
+            if not consistent:
+                break
+
+        set_ = self.store.set
+        for i, j in zip(*np.nonzero(matrix != original)):
+            set_(int(i), int(j), int(matrix[i, j]))
+
+        return consistent
+
+    def isPointisable(self):
+
+        if not self.constraintCalculator.allen:
+            return False
+        membership = relationSubclass('pointisable')
+        return all(membership[relation]
+                   for _, _, relation in self.store.relations())
+
+    def propagatePoints(self):
+        """
+        Decide consistency of a network of pointisable relations on the
+        endpoints of its intervals in linear time.
+
+        Every relation becomes point algebra constraints between the
+        endpoints, drawn as <= edges (strict for <) in a graph where
+        each start precedes its end. The network is consistent unless a
+        strongly connected component, whose endpoints must be equal,
+        contains a strict edge or two endpoints required to differ.
+        """
+
+        return self._endpointComponents(self.store.relations()) is not None
+
+    def _endpointComponents(self, relations):
+        """
+        The endpoint graph of propagatePoints for (i, j, relation)
+        triples, as the successor lists of endpoints 2 * i (start) and
+        2 * i + 1 (end) and their strongly connected component numbers,
+        or None when the constraints are inconsistent
+        """
+
+        size = 2 * len(self.nodeList)
+        points = pointRelations()
+        successors = [[(point + 1, True)] if point % 2 == 0 else []
+                      for point in range(size)]
+        distinct = []
+
+        for i, j, relation in relations:
+            for n, (p, q) in enumerate(ENDPOINT_PAIRS):
+                pointRel = points[4 * relation + n]
+                if not pointRel:
+                    return None
+                p += 2 * i
+                q += 2 * j
+                strict = not pointRel & POINT_EQ
+                if not pointRel & POINT_GT:
+                    successors[p].append((q, strict))
+                if not pointRel & POINT_LT:
+                    successors[q].append((p, strict))
+                if pointRel == POINT_LT | POINT_GT:
+                    distinct.append((p, q))
+
+        component = _stronglyConnectedComponents(
+            [[q for q, _ in edges] for edges in successors])
+
+        for p, edges in enumerate(successors):
+            for q, strict in edges:
+                if strict and component[p] == component[q]:
+                    return None
+        if any(component[p] == component[q] for p, q in distinct):
+            return None
+        return successors, component
+
+    def timeline(self):
+        """
+        The interval endpoints of one consistent scenario in timeline
+        order, as an iterator of (position, node, endpoint) tuples where
+        endpoint is 0 for the start and 1 for the end of the node's
+        interval and equal endpoints share a position. Returns None when
+        the network is inconsistent.
+
+        Pointisable networks are ordered directly from the endpoint
+        graph of propagatePoints: its strongly connected components are
+        the endpoints that must be equal, and a topological order of
+        them, smallest node index first, satisfies every relation.
+        Other networks are first narrowed to a scenario by the Solver.
+        """
+
+        if not self.constraintCalculator.allen:
+            raise ValueError('A timeline needs a network of Allen relations')
+
+        if self.isPointisable():
+            relations = self.store.relations()
+        else:
+            # solver imports this module
+            from solver import Solver
+            scenario = Solver(self).scenario()
+            if scenario is None:
+                return None
+            nodeIndex = self.nodeIndex
+            relations = ((nodeIndex[nodeA], nodeIndex[nodeB], relation)
+                         for (nodeA, nodeB), relation in scenario.items())
+
+        graph = self._endpointComponents(relations)
+        if graph is None:
+            return None
+        return self._topologicalEndpoints(*graph)
+
+    def _topologicalEndpoints(self, successors, component):
+
+        count = max(component) + 1 if component else 0
+        members = [[] for _ in range(count)]
+        for point, number in enumerate(component):
+            members[number].append(point)
+
+        later = [set() for _ in range(count)]
+        for p, edges in enumerate(successors):
+            for q, _ in edges:
+                if component[p] != component[q]:
+                    later[component[p]].add(component[q])
+        earlier = [0] * count
+        for numbers in later:
+            for number in numbers:
+                earlier[number] += 1
+
+        # components are keyed by their first endpoint, so that ties
+        # are broken in node order
+        ready = [(points[0], number) for number, points in enumerate(members)
+                 if not earlier[number]]
+        heapq.heapify(ready)
+        nodeList = self.nodeList
+        position = 0
+        while ready:
+            _, number = heapq.heappop(ready)
+            for point in members[number]:
+                yield position, nodeList[point // 2], point % 2
+            position += 1
+            for successor in later[number]:
+                earlier[successor] -= 1
+                if not earlier[successor]:
+                    heapq.heappush(ready, (members[successor][0], successor))
+
+    def propagateThreads(self, seedPairs=None):
+        """
+        Path consistency in rounds over a dense copy of the relations,
+        with the third nodes k split into blocks closed by a thread
+        pool, for free-threaded Python builds.
+
+        In a round every thread narrows the pairs (i, j) through the k
+        of its block against the relations at the start of the round
+        and keeps the results to itself; they are then merged with &.
+        Only the k of a pair narrowed in the previous round (or of
+        seedPairs, after a closure) are visited again. Relations only
+        shrink, so the rounds end at the same fixpoint as propagate.
+        """
+
+        self.supportsIncomplete = True
+
+        size = len(self.nodeList)
+        universal = self.universal
+        converse = self.converse
+        compose = self.compositionTable.compose
+
+        matrix = array('H', [universal]) * (size * size)
+        for i, j, relation in self.store.relations():
+            matrix[i * size + j] = relation
+        for i in range(size):
+            matrix[i * size + i] = self.identity
+        original = array('H', matrix)
+
+        if seedPairs is None:
+            active = range(size)
+        else:
+            active = sorted(set(node for pair in seedPairs
+                                for node in pair))
+
+        maxWorkers = self.maxWorkers or os.cpu_count() or 1
+        consistent = 0 not in matrix
+
+        with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+            while consistent and active:
+                blockSize = -(-len(active) // (4 * maxWorkers))
+                blocks = [active[n:n + blockSize]
+                          for n in range(0, len(active), blockSize)]
+                results = executor.map(
+                    lambda block: _narrowBlock(matrix, size, universal,
+                                               compose, block), blocks)
+
+                narrowed = {}
+                for updates in results:
+                    for index, relation in updates.items():
+                        narrowed[index] = narrowed.get(
+                            index, relation) & relation
+
+                changedNodes = set()
+                for index, relation in narrowed.items():
+                    i, j = divmod(index, size)
+                    relation &= converse[matrix[j * size + i]]
+                    if relation == 0:
+                        consistent = False
+                        break
+                    matrix[index] = relation
+                    matrix[j * size + i] = converse[relation]
+                    changedNodes.add(i)
+                    changedNodes.add(j)
+                active = sorted(changedNodes)
+
+        set_ = self.store.set
+        for index in range(size * size):
+            if matrix[index] != original[index]:
+                i, j = divmod(index, size)
+                set_(i, j, matrix[index])
+
+        return consistent
+
     def makePairs(self, nodes):
 
-        pairs = []
-        for nodeI in nodes:
-            for nodeJ in nodes:
+        nodes = list(nodes)
+        return [set([nodeI, nodeJ]) for i, nodeI in enumerate(nodes)
+                for nodeJ in nodes[i + 1:]]
+
+
+class PropagationStats:
+
+    """
+    Counters and phase timings of the closures of a ConstraintNetwork
+    created with profile=True, accumulated until reset. Networks
+    without it take the uninstrumented code paths.
+    """
+
+    def __init__(self):
+
+        self.reset()
+
+    def reset(self):
+
+        self.calls = 0
+        self.pushes = 0
+        self.pops = 0
+        self.maxQueue = 0
+        self.compositions = 0
+        self.revisions = defaultdict(int)
+        self.phases = defaultdict(float)
+
+    @property
+    def lookups(self):
+
+        # every composition reads the low and the high half table
+        return 2 * self.compositions
+
+    def recordPhase(self, phase, start):
+        """Add the time since start to phase and return the time now."""
+
+        now = time.perf_counter()
+        self.phases[phase] += now - start
+        return now
+
+    def countingFunctions(self, compose, set_):
+        """
+        Wrap the compose and set functions of propagate so that they
+        count compositions and the revisions of every (i, j) pair, i < j
+        """
+
+        revisions = self.revisions
+
+        def countingCompose(rel1, rel2):
+            self.compositions += 1
+            return compose(rel1, rel2)
+
+        def countingSet(i, j, relation):
+            # each revision writes (i, j) and (j, i)
+            if i < j:
+                revisions[(i, j)] += 1
+            set_(i, j, relation)
+
+        return countingCompose, countingSet
+
+    def asDict(self):
+
+        revisions = self.revisions.values()
+        return {'calls': self.calls,
+                'pushes': self.pushes,
+                'pops': self.pops,
+                'maxQueue': self.maxQueue,
+                'compositions': self.compositions,
+                'lookups': self.lookups,
+                'revisions': sum(revisions),
+                'revisedPairs': len(self.revisions),
+                'maxRevisions': max(revisions) if self.revisions else 0,
+                'phases': dict(self.phases)}
 
-                if nodeI != nodeJ and set([nodeI, nodeJ]) not in pairs:
+    def logLine(self):
 
-                    pairs.append(set([nodeI, nodeJ]))
+        return 'propagation stats ' + json.dumps(self.asDict(),
+                                                 sort_keys=True)
 
-        return pairs
+
+class _CountingQueue(deque):
+
+    """The propagate work queue of a profiled network."""
+
+    def __init__(self, stats):
+
+        deque.__init__(self)
+        self.stats = stats
+
+    def append(self, pair):
+
+        deque.append(self, pair)
+        self.stats.pushes += 1
+        if len(self) > self.stats.maxQueue:
+            self.stats.maxQueue = len(self)
+
+    def popleft(self):
+
+        self.stats.pops += 1
+        return deque.popleft(self)
 
 
 class TemporalRelation:
@@ -217,21 +1141,73 @@ class TemporalRelation:
     EQUAL = int('1000000000000', 2)
     ALL = int('1111111111111', 2)
 
-    RELATION_TO_BIT = {'<': BEFORE,
-                       '>': AFTER,
-                       'd': DURING,
-                       'di': DURING_BY,
-                       'o': OVERLAP,
-                       'oi': OVERLAP_BY,
-                       's': STARTS,
-                       'si': STARTED_BY,
-                       'f': FINISHES,
-                       'fi': FINISHED_BY,
-                       'm': MEETS,
-                       'mi': MEET_BY,
-                       '=': EQUAL,
-                       'all': ALL
-                       }
+    # the single definition of the basic relations, in bit order:
+    # (bit, name, symbol in transitive_table.txt, converse)
+    BASIC_RELATIONS = ((BEFORE, 'before', '<', AFTER),
+                       (AFTER, 'after', '>', BEFORE),
+                       (DURING, 'during', 'd', DURING_BY),
+                       (DURING_BY, 'during_by', 'di', DURING),
+                       (OVERLAP, 'overlap', 'o', OVERLAP_BY),
+                       (OVERLAP_BY, 'overlap_by', 'oi', OVERLAP),
+                       (STARTS, 'starts', 's', STARTED_BY),
+                       (STARTED_BY, 'started_by', 'si', STARTS),
+                       (FINISHES, 'finish', 'f', FINISHED_BY),
+                       (FINISHED_BY, 'finish_by', 'fi', FINISHES),
+                       (MEETS, 'meets', 'm', MEET_BY),
+                       (MEET_BY, 'meet_by', 'mi', MEETS),
+                       (EQUAL, 'equal', '=', EQUAL))
+
+    # positions of the endpoints (x-, x+, y-, y+) of x and y in one
+    # model of x r y for every basic relation r
+    ENDPOINTS = {BEFORE: (0, 1, 2, 3),
+                 AFTER: (2, 3, 0, 1),
+                 DURING: (1, 2, 0, 3),
+                 DURING_BY: (0, 3, 1, 2),
+                 OVERLAP: (0, 2, 1, 3),
+                 OVERLAP_BY: (1, 3, 0, 2),
+                 STARTS: (0, 1, 0, 2),
+                 STARTED_BY: (0, 2, 0, 1),
+                 FINISHES: (1, 2, 0, 2),
+                 FINISHED_BY: (0, 2, 1, 2),
+                 MEETS: (0, 1, 1, 2),
+                 MEET_BY: (1, 2, 0, 1),
+                 EQUAL: (0, 1, 0, 1)}
+
+    # filled in from BASIC_RELATIONS below the class
+    RELATION_TO_BIT = {}
+    NAME_TO_BIT = {}
+    INVERSE = None
+    STRINGS = None
+
+    @staticmethod
+    def intervalRelation(interval1, interval2):
+        """
+        The basic relation between two intervals given as (start, end)
+        """
+
+        (start1, end1), (start2, end2) = interval1, interval2
+        if end1 < start2:
+            return TemporalRelation.BEFORE
+        if end2 < start1:
+            return TemporalRelation.AFTER
+        if end1 == start2:
+            return TemporalRelation.MEETS
+        if end2 == start1:
+            return TemporalRelation.MEET_BY
+        if start1 == start2 and end1 == end2:
+            return TemporalRelation.EQUAL
+        if start1 == start2:
+            return (TemporalRelation.STARTS if end1 < end2
+                    else TemporalRelation.STARTED_BY)
+        if end1 == end2:
+            return (TemporalRelation.FINISHES if start1 > start2
+                    else TemporalRelation.FINISHED_BY)
+        if start2 < start1 and end1 < end2:
+            return TemporalRelation.DURING
+        if start1 < start2 and end2 < end1:
+            return TemporalRelation.DURING_BY
+        return (TemporalRelation.OVERLAP if start1 < start2
+                else TemporalRelation.OVERLAP_BY)
 
     @staticmethod
     def combine(relationSet):
@@ -247,34 +1223,7 @@ class TemporalRelation:
     @staticmethod
     def inverse(relations):
 
-        inverseRel = int('0', 2)
-
-        if TemporalRelation.BEFORE & relations:
-            inverseRel |= TemporalRelation.AFTER
-        if TemporalRelation.AFTER & relations:
-            inverseRel |= TemporalRelation.BEFORE
-        if TemporalRelation.DURING & relations:
-            inverseRel |= TemporalRelation.DURING_BY
-        if TemporalRelation.DURING_BY & relations:
-            inverseRel |= TemporalRelation.DURING
-        if TemporalRelation.OVERLAP & relations:
-            inverseRel |= TemporalRelation.OVERLAP_BY
-        if TemporalRelation.STARTS & relations:
-            inverseRel |= TemporalRelation.STARTED_BY
-        if TemporalRelation.STARTED_BY & relations:
-            inverseRel |= TemporalRelation.STARTS
-        if TemporalRelation.FINISHES & relations:
-            inverseRel |= TemporalRelation.FINISHED_BY
-        if TemporalRelation.FINISHED_BY & relations:
-            inverseRel |= TemporalRelation.FINISHES
-        if TemporalRelation.MEETS & relations:
-            inverseRel |= TemporalRelation.MEET_BY
-        if TemporalRelation.MEET_BY & relations:
-            inverseRel |= TemporalRelation.MEETS
-        if TemporalRelation.EQUAL & relations:
-            inverseRel |= TemporalRelation.EQUAL
-
-        return inverseRel
+        return TemporalRelation.INVERSE[relations]
 
     @staticmethod
     def intersect(rel1, rel2):
@@ -284,36 +1233,278 @@ class TemporalRelation:
     @staticmethod
     def relationToString(relations):
 
-        relationStr = []
-
-        if TemporalRelation.BEFORE & relations:
-            relationStr.append('before')
-        if TemporalRelation.AFTER & relations:
-            relationStr.append('after')
-        if TemporalRelation.DURING & relations:
-            relationStr.append('during')
-        if TemporalRelation.DURING_BY & relations:
-            relationStr.append('during_by')
-        if TemporalRelation.OVERLAP & relations:
-            relationStr.append('overlap')
-        if TemporalRelation.OVERLAP_BY & relations:
-            relationStr.append('overlap_by')
-        if TemporalRelation.STARTS & relations:
-            relationStr.append('starts')
-        if TemporalRelation.STARTED_BY & relations:
-            relationStr.append('started_by')
-        if TemporalRelation.FINISHES & relations:
-            relationStr.append('finish')
-        if TemporalRelation.FINISHED_BY & relations:
-            relationStr.append('finish_by')
-        if TemporalRelation.MEETS & relations:
-            relationStr.append('meets')
-        if TemporalRelation.MEET_BY & relations:
-            relationStr.append('meet_by')
-        if TemporalRelation.EQUAL & relations:
-            relationStr.append('equal')
-
-        return ','.join(relationStr)
+        return TemporalRelation.STRINGS[relations]
+
+    @staticmethod
+    def relationFromString(relationStr):
+        """
+        Parse relation names (as written by relationToString) or
+        transitive table symbols separated by commas or spaces
+        """
+
+        relations = int('0', 2)
+
+        for indRel in relationStr.replace(',', ' ').split():
+            if indRel in TemporalRelation.NAME_TO_BIT:
+                relations |= TemporalRelation.NAME_TO_BIT[indRel]
+            elif indRel in TemporalRelation.RELATION_TO_BIT:
+                relations |= TemporalRelation.RELATION_TO_BIT[indRel]
+            else:
+                raise ValueError('Undefined relation: {}'.format(indRel))
+
+        return relations
+
+
+def _buildRelationTables(relationClass):
+    """
+    Derive the symbol and name maps and the converse and string tables
+    of every disjunctive relation from BASIC_RELATIONS
+    """
+
+    size = relationClass.ALL + 1
+    inverse = array('H', bytes(2 * size))
+    strings = [''] * size
+    names = [''] * size
+
+    for bit, name, symbol, converse in relationClass.BASIC_RELATIONS:
+        relationClass.RELATION_TO_BIT[symbol] = bit
+        relationClass.NAME_TO_BIT[name] = bit
+        names[bit] = name
+        inverse[bit] = converse
+    relationClass.RELATION_TO_BIT['all'] = relationClass.ALL
+
+    for relations in range(1, size):
+        lowestBit = relations & -relations
+        rest = relations ^ lowestBit
+        inverse[relations] = inverse[lowestBit] | inverse[rest]
+        strings[relations] = (names[lowestBit] + ',' + strings[rest]
+                              if rest else names[lowestBit])
+
+    relationClass.INVERSE = inverse
+    relationClass.STRINGS = strings
+
+
+_buildRelationTables(TemporalRelation)
+
+
+def _endpointClauseMasks(subclass):
+    """
+    The sets of basic relations satisfying each endpoint formula that
+    defines a subclass: conjunctions of <, <= and = for 'convex',
+    single <=, = and != atoms for 'pointisable', and ORD-Horn clauses
+    (any != atoms and at most one <= or = atom) for 'ord-horn'
+    """
+
+    def mask(holds):
+        return TemporalRelation.combine(
+            bit for bit, endpoints in TemporalRelation.ENDPOINTS.items()
+            if holds(endpoints))
+
+    points = range(4)
+    orderedPairs = [(p, q) for p in points for q in points if p != q]
+    pairs = [(p, q) for p, q in orderedPairs if p < q]
+
+    if subclass == 'convex':
+        atoms = [lambda e, p=p, q=q: e[p] < e[q] for p, q in orderedPairs]
+    else:
+        atoms = [lambda e, p=p, q=q: e[p] != e[q] for p, q in pairs]
+    atoms += [lambda e, p=p, q=q: e[p] <= e[q] for p, q in orderedPairs]
+    atoms += [lambda e, p=p, q=q: e[p] == e[q] for p, q in pairs]
+
+    if subclass in ('convex', 'pointisable'):
+        return set(mask(atom) for atom in atoms)
+
+    if subclass != 'ord-horn':
+        raise ValueError('Undefined subclass: {}'.format(subclass))
+
+    masks = set()
+    positiveAtoms = [None] + atoms[len(pairs):]
+    for size in range(len(pairs) + 1):
+        for negated in itertools.combinations(pairs, size):
+            for positive in positiveAtoms:
+                masks.add(mask(
+                    lambda e, negated=negated, positive=positive:
+                    any(e[p] != e[q] for p, q in negated) or
+                    (positive is not None and positive(e))))
+    return masks
+
+
+_relationSubclasses = {}
+
+
+def relationSubclass(subclass):
+    """
+    Membership flags, indexed by relation, of a tractable subclass of
+    the Allen relations: 'convex' (83 relations), 'pointisable' (188)
+    or 'ord-horn' (868), the empty relation included.
+
+    A relation belongs to the subclass when it is exactly the set of
+    basic relations satisfying the subclass formulas it satisfies.
+    """
+
+    membership = _relationSubclasses.get(subclass)
+
+    if membership is None:
+        masks = _endpointClauseMasks(subclass)
+        membership = bytearray(TemporalRelation.ALL + 1)
+        membership[0] = 1
+        for relations in range(1, TemporalRelation.ALL + 1):
+            closure = TemporalRelation.ALL
+            for mask in masks:
+                if relations & mask == relations:
+                    closure &= mask
+            membership[relations] = closure == relations
+        _relationSubclasses[subclass] = membership
+
+    return membership
+
+
+POINT_LT = 1
+POINT_EQ = 2
+POINT_GT = 4
+
+# the (x, y) endpoints compared by pointRelations, as offsets of the
+# start (0) and end (1) of the two intervals
+ENDPOINT_PAIRS = ((0, 0), (0, 1), (1, 0), (1, 1))
+
+_pointRelations = []
+
+
+def pointRelations():
+    """
+    The point algebra relation, as a mask of POINT_LT, POINT_EQ and
+    POINT_GT, between the endpoints of each ENDPOINT_PAIRS entry for
+    every Allen relation, at index 4 * relation + entry
+    """
+
+    if not _pointRelations:
+        basic = {}
+        for bit, endpoints in TemporalRelation.ENDPOINTS.items():
+            basic[bit] = []
+            for p, q in ENDPOINT_PAIRS:
+                x = endpoints[p]
+                y = endpoints[2 + q]
+                basic[bit].append(POINT_LT if x < y else
+                                  POINT_EQ if x == y else POINT_GT)
+
+        table = array('B', bytes(4 * (TemporalRelation.ALL + 1)))
+        for relations in range(1, TemporalRelation.ALL + 1):
+            for bit, pointRels in basic.items():
+                if bit & relations:
+                    for n, pointRel in enumerate(pointRels):
+                        table[4 * relations + n] |= pointRel
+        _pointRelations.append(table)
+
+    return _pointRelations[0]
+
+
+def quickXplain(constraints, isConsistent):
+    """
+    A minimal subset of an inconsistent list of constraints for which
+    isConsistent(subset) is False, with the QuickXplain divide and
+    conquer of Junker (2004): O(k log(n / k)) checks for a conflict of
+    k of n constraints.
+    """
+
+    def explain(background, delta, candidates):
+
+        if delta and not isConsistent(background):
+            return []
+        if len(candidates) == 1:
+            return list(candidates)
+
+        half = len(candidates) // 2
+        first = candidates[:half]
+        second = candidates[half:]
+        conflict2 = explain(background + first, first, second)
+        conflict1 = explain(background + conflict2, conflict2, first)
+        return conflict1 + conflict2
+
+    constraints = list(constraints)
+    if not constraints or isConsistent(constraints):
+        return None
+    return explain([], [], constraints)
+
+
+def _narrowBlock(matrix, size, universal, compose, block):
+    """
+    The relations of a flat size * size matrix narrowed by composition
+    through the nodes k of block, as {i * size + j: relation} for those
+    that changed
+    """
+
+    updates = {}
+    for k in block:
+        rows = [i for i in range(size)
+                if matrix[i * size + k] != universal and i != k]
+        cols = [j for j in range(size)
+                if matrix[k * size + j] != universal and j != k]
+        rowK = k * size
+
+        for i in rows:
+            relation_i_k = matrix[i * size + k]
+            rowI = i * size
+            for j in cols:
+                if i == j:
+                    continue
+                index = rowI + j
+                existing = updates.get(index, matrix[index])
+                relation = existing & compose(relation_i_k,
+                                              matrix[rowK + j])
+                if relation != existing:
+                    updates[index] = relation
+
+    return updates
+
+
+def _stronglyConnectedComponents(successors):
+    """
+    Component number of every vertex of a graph given as successor
+    lists, with an iterative Tarjan search
+    """
+
+    size = len(successors)
+    index = [None] * size
+    lowLink = [0] * size
+    component = [None] * size
+    stack = []
+    counter = 0
+    components = 0
+
+    for root in range(size):
+        if index[root] is not None:
+            continue
+
+        index[root] = lowLink[root] = counter
+        counter += 1
+        stack.append(root)
+        work = [(root, iter(successors[root]))]
+
+        while work:
+            vertex, edges = work[-1]
+            for successor in edges:
+                if index[successor] is None:
+                    index[successor] = lowLink[successor] = counter
+                    counter += 1
+                    stack.append(successor)
+                    work.append((successor, iter(successors[successor])))
+                    break
+                if component[successor] is None:
+                    lowLink[vertex] = min(lowLink[vertex], index[successor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowLink[parent] = min(lowLink[parent], lowLink[vertex])
+                if lowLink[vertex] == index[vertex]:
+                    while True:
+                        member = stack.pop()
+                        component[member] = components
+                        if member == vertex:
+                            break
+                    components += 1
+
+    return component
 
 
 class TimeMLRelation:
@@ -333,15 +1524,99 @@ class TimeMLRelation:
                        'BEGUN_BY': TemporalRelation.STARTED_BY,
                        'ENDED_BY': TemporalRelation.FINISHED_BY}
 
+    # the relTypes grouped into each relation of the reduced calculus
+    # of data/timeml_table.txt; VAGUE takes the Allen relations that no
+    # relType maps to
+    REDUCED_RELTYPES = {'BEFORE': ('BEFORE', 'IBEFORE'),
+                        'AFTER': ('AFTER', 'IAFTER'),
+                        'INCLUDES': ('INCLUDES', 'BEGUN_BY', 'ENDED_BY'),
+                        'IS_INCLUDED': ('IS_INCLUDED', 'BEGINS', 'ENDS'),
+                        'SIMULTANEOUS': ('SIMULTANEOUS',),
+                        'VAGUE': ()}
+
+    @staticmethod
+    def reducedClasses():
+        """The Allen relations of every reduced relation name"""
+
+        classes = {}
+        for name, relTypes in TimeMLRelation.REDUCED_RELTYPES.items():
+            classes[name] = TemporalRelation.combine(
+                TimeMLRelation.TIMEML_TO_ALLEN[relType]
+                for relType in relTypes)
+        classes['VAGUE'] = TemporalRelation.ALL ^ TemporalRelation.combine(
+            classes.values())
+        return classes
+
+
+class RelationProjection:
+
+    """
+    Maps the relations of a calculus onto a coarser one whose basic
+    relations are unions (classes) of its basic relations.
+
+    project gives the smallest coarse relation containing a relation
+    and lift the fine relations of a coarse one. Composition in the
+    coarse table over-approximates the fine one, so closing a projected
+    network never loses a solution: an inconsistent projection proves
+    the network inconsistent, and lifting the closed projection back
+    only removes relations that no solution uses.
+    """
+
+    def __init__(self, fine, coarse, classes):
+
+        self.fine = fine
+        self.coarse = coarse
+        self.projectTable = array('H', bytes(2 * (fine.universal + 1)))
+        self.liftTable = array('H', bytes(2 * (coarse.universal + 1)))
+
+        for name, fineRelations in classes.items():
+            coarseBit = coarse.relationToBit[name]
+            self.liftTable[coarseBit] = fineRelations
+            for relations in range(1, fine.universal + 1):
+                if relations & fineRelations:
+                    self.projectTable[relations] |= coarseBit
+
+        for relations in range(1, coarse.universal + 1):
+            lowestBit = relations & -relations
+            self.liftTable[relations] = \
+                self.liftTable[relations ^ lowestBit] | \
+                self.liftTable[lowestBit]
+
+    def project(self, relations):
+
+        return self.projectTable[relations]
+
+    def lift(self, relations):
+
+        return self.liftTable[relations]
+
+
+_timeMLProjections = []
+
+
+def timeMLProjection():
+    """
+    The RelationProjection of the Allen relations onto the TimeML
+    calculus of CALCULI['timeml'], shared by the process
+    """
+
+    if not _timeMLProjections:
+        _timeMLProjections.append(RelationProjection(
+            loadTransitiveConstraints(CALCULI['allen']),
+            loadTransitiveConstraints(CALCULI['timeml']),
+            TimeMLRelation.reducedClasses()))
+    return _timeMLProjections[0]
+
 
 class Link:
 
     """
     """
 
+    logger = logging.getLogger('Link')
+
     def __init__(self, source, destination, relationSet=None):
 
-        self.logger = logging.getLogger('Link')
         self.source = source
         self.destination = destination
         self.relation = None
@@ -364,46 +1639,562 @@ class Link:
         return self.destination
 
 
+class LinkView(Link):
+
+    """
+    A Link whose relation is read from and written to a relation store
+    """
+
+    def __init__(self, store, i, j):
+
+        self.store = store
+        self.i = i
+        self.j = j
+        self.source = store.nodeList[i]
+        self.destination = store.nodeList[j]
+
+    @property
+    def relation(self):
+        return self.store.get(self.i, self.j)
+
+    @relation.setter
+    def relation(self, relation):
+        self.store.set(self.i, self.j, relation)
+
+
+class LinkStore:
+
+    """
+    Stores one Link object per ordered node pair in a defaultdict
+    """
+
+    def __init__(self, nodeList, nodeIndex, default=TemporalRelation.ALL):
+
+        self.nodeList = nodeList
+        self.nodeIndex = nodeIndex
+        self.default = default
+        self.networkDict = defaultdict(dict)
+
+    def addNode(self, node):
+
+        networkDict = self.networkDict
+        for existingNode in self.nodeList:
+            if existingNode is node:
+                continue
+            link = Link(node, existingNode)
+            link.relation = self.default
+            networkDict[node][existingNode] = link
+            link = Link(existingNode, node)
+            link.relation = self.default
+            networkDict[existingNode][node] = link
+
+    def get(self, i, j):
+
+        nodeList = self.nodeList
+        return self.networkDict[nodeList[i]][nodeList[j]].relation
+
+    def set(self, i, j, relation):
+
+        nodeList = self.nodeList
+        self.networkDict[nodeList[i]][nodeList[j]].relation = relation
+
+    def neighbors(self, i, j, members=None):
+
+        if members is not None:
+            return members
+        return range(len(self.nodeList))
+
+    def pairs(self):
+
+        size = len(self.nodeList)
+        return ((i, j) for i in range(size) for j in range(i + 1, size))
+
+    def relations(self):
+
+        nodeIndex = self.nodeIndex
+        for source, row in self.networkDict.items():
+            for destination, link in row.items():
+                if link.relation != self.default:
+                    yield (nodeIndex[source], nodeIndex[destination],
+                           link.relation)
+
+
+class MatrixStore:
+
+    """
+    Stores relations in a dense array('H') matrix indexed by the
+    network's node indices. The capacity doubles when it is exceeded.
+    networkDict gives the usual networkDict[a][b].relation access
+    through LinkView objects created on demand.
+    """
+
+    def __init__(self, nodeList, nodeIndex, default=TemporalRelation.ALL):
+
+        self.nodeList = nodeList
+        self.nodeIndex = nodeIndex
+        self.default = default
+        self.capacity = 0
+        self.matrix = array('H')
+        self.networkDict = NetworkDictView(self)
+
+    def addNode(self, node):
+
+        size = len(self.nodeList)
+        if size <= self.capacity:
+            return
+
+        capacity = max(8, 2 * self.capacity)
+        while capacity < size:
+            capacity *= 2
+
+        matrix = array('H', [self.default]) * (capacity * capacity)
+        oldCapacity = self.capacity
+        for i in range(oldCapacity):
+            matrix[i * capacity:i * capacity + oldCapacity] = \
+                self.matrix[i * oldCapacity:(i + 1) * oldCapacity]
+
+        self.matrix = matrix
+        self.capacity = capacity
+
+    def get(self, i, j):
+
+        return self.matrix[i * self.capacity + j]
+
+    def set(self, i, j, relation):
+
+        self.matrix[i * self.capacity + j] = relation
+
+    def neighbors(self, i, j, members=None):
+
+        if members is not None:
+            return members
+        return range(len(self.nodeList))
+
+    def pairs(self):
+
+        size = len(self.nodeList)
+        return ((i, j) for i in range(size) for j in range(i + 1, size))
+
+    def relations(self):
+
+        matrix = self.matrix
+        capacity = self.capacity
+        size = len(self.nodeList)
+        for i in range(size):
+            for j in range(size):
+                relation = matrix[i * capacity + j]
+                if relation != self.default and i != j:
+                    yield i, j, relation
+
+
+class SparseStore:
+
+    """
+    Stores only the relations that differ from the default (ALL), one
+    dict per node index. Absent pairs are implicitly unconstrained.
+
+    Composing ALL with any non-empty relation gives ALL, so propagation
+    from a pair (i, j) only has to visit the constrained neighbours of
+    i and j, and only constrained pairs need to be queued.
+    """
+
+    def __init__(self, nodeList, nodeIndex, default=TemporalRelation.ALL):
+
+        self.nodeList = nodeList
+        self.nodeIndex = nodeIndex
+        self.default = default
+        self.rows = []
+        self.networkDict = NetworkDictView(self)
+
+    def addNode(self, node):
+
+        while len(self.rows) < len(self.nodeList):
+            self.rows.append({})
+
+    def get(self, i, j):
+
+        return self.rows[i].get(j, self.default)
+
+    def set(self, i, j, relation):
+
+        if relation == self.default:
+            self.rows[i].pop(j, None)
+        else:
+            self.rows[i][j] = relation
+
+    def neighbors(self, i, j, members=None):
+
+        # the stored entries of i and j never leave their component
+        return self.rows[i].keys() | self.rows[j].keys()
+
+    def pairs(self):
+
+        rows = self.rows
+        return ((i, j) for i, row in enumerate(rows)
+                for j in row if i < j or i not in rows[j])
+
+    def relations(self):
+
+        return ((i, j, relation) for i, row in enumerate(self.rows)
+                for j, relation in row.items())
+
+
+class NetworkDictView:
+
+    """
+    Read-write networkDict[source][destination] access to a relation
+    store that does not keep Link objects
+    """
+
+    def __init__(self, store):
+
+        self.store = store
+
+    def __getitem__(self, source):
+
+        return NetworkDictRowView(self.store, self.store.nodeIndex[source])
+
+    def __contains__(self, source):
+
+        return source in self.store.nodeIndex
+
+    def __iter__(self):
+
+        return iter(self.store.nodeList)
+
+    def __len__(self):
+
+        return len(self.store.nodeList)
+
+
+class NetworkDictRowView:
+
+    def __init__(self, store, i):
+
+        self.store = store
+        self.i = i
+
+    def __getitem__(self, destination):
+
+        j = self.store.nodeIndex[destination]
+        if j == self.i:
+            raise KeyError(destination)
+        return LinkView(self.store, self.i, j)
+
+    def __contains__(self, destination):
+
+        return (destination in self.store.nodeIndex and
+                self.store.nodeIndex[destination] != self.i)
+
+    def __iter__(self):
+
+        source = self.store.nodeList[self.i]
+        return (node for node in self.store.nodeList if node is not source)
+
+    def __len__(self):
+
+        return max(0, len(self.store.nodeList) - 1)
+
+
+ENGINES = ('python', 'numpy', 'points', 'threads')
+
+RELATION_STORES = {'links': LinkStore,
+                   'matrix': MatrixStore,
+                   'sparse': SparseStore}
+
+
 class TransitiveConstraints:
 
     """
+    A qualitative calculus read from a table file: its basic relations,
+    their converses and the composition of every two of them.
+
+    Table files have one 'relation1,relation2,composition' line per
+    pair of basic relations, where composition lists basic relations
+    separated by spaces. Optional headers name the calculus and give its
+    basic relations in bit order, their converses and its identity
+    relation:
+
+        name: point
+        relations: < = >
+        converses: > = <
+        identity: =
+
+    Files without a relations header, like data/transitive_table.txt,
+    hold the 13 Allen relations of TemporalRelation. Lines starting
+    with '#' are comments.
     """
 
-    def __init__(self, transitive_table):
+    CACHE_MAGIC = b'TTBL'
+    CACHE_VERSION = 2
+    # magic, version, width, source mtime (ns), source size, JSON bytes
+    CACHE_HEADER = struct.Struct('<4sHHqQQ')
+
+    def __init__(self, transitive_table, cacheFile=None):
 
         self.logger = logging.getLogger('TransitiveConstraints')
 
         self.transitive_table = transitive_table
+        self.cacheFile = cacheFile
+        # the compiled CompositionTable of the cache file, until
+        # getCompositionTable takes it
+        self.cachedCompositionTable = None
 
         self.logger.info('creating an instance of TransitiveConstraints')
         self.basicConstraints = defaultdict(dict)
-        self.storeBasicConstraints()
+        if cacheFile is None or not self.loadCache(cacheFile):
+            self.storeBasicConstraints()
+            if cacheFile is not None:
+                self.saveCache(cacheFile)
+
+    def __getstate__(self):
+
+        state = self.__dict__.copy()
+        state['cachedCompositionTable'] = None
+        return state
+
+    def basicTable(self):
+        """
+        The compositions of the basic relations as a flat array, with
+        that of 1 << p and 1 << q at p * width + q
+        """
+
+        width = self.width
+        table = array('H', bytes(2 * width * width))
+        for p in range(width):
+            row = self.basicConstraints.get(1 << p, {})
+            for q in range(width):
+                table[p * width + q] = row.get(1 << q, 0)
+        return table
+
+    def saveCache(self, cacheFile, compositionTable=None):
+        """
+        Write the parsed table, and the low and high halves of its
+        compiled compositionTable when given, to a binary file stamped
+        with the mtime and size of the table file; failures are only
+        logged
+        """
+
+        source = os.stat(self.transitive_table)
+        meta = json.dumps({
+            'name': self.name,
+            'relations': None if self.allen else self.relationNames,
+            'converses': None if self.allen else [
+                self.relationNames[self.converse[1 << n].bit_length() - 1]
+                for n in range(self.width)],
+            'identity': self.relationNames[self.identity.bit_length() - 1],
+        }).encode('utf-8')
+
+        tables = [self.basicTable()]
+        if compositionTable is not None:
+            tables.extend([array('H', compositionTable.low),
+                           array('H', compositionTable.high)])
+        if sys.byteorder != 'little':
+            for table in tables:
+                table.byteswap()
+
+        temporaryFile = '{}.{}.tmp'.format(cacheFile, os.getpid())
+        try:
+            with open(temporaryFile, 'wb') as outobj:
+                outobj.write(self.CACHE_HEADER.pack(
+                    self.CACHE_MAGIC, self.CACHE_VERSION, self.width,
+                    source.st_mtime_ns, source.st_size, len(meta)))
+                outobj.write(meta)
+                for table in tables:
+                    table.tofile(outobj)
+            os.replace(temporaryFile, cacheFile)
+        except OSError as exc:
+            self.logger.warning('Cannot write table cache {}: {}'.format(
+                cacheFile, exc))
+
+    def _readCache(self, cacheFile):
+        """
+        The metadata, basic table and CompositionTable (None when it
+        was not saved) of a file written by saveCache, read with a
+        single read, or None when it is missing, unreadable or older
+        than the table
+        """
+
+        try:
+            with open(cacheFile, 'rb') as inobj:
+                data = inobj.read()
+            source = os.stat(self.transitive_table)
+        except OSError:
+            return None
+
+        header = self.CACHE_HEADER
+        try:
+            magic, version, width, mtime, size, metaSize = \
+                header.unpack_from(data)
+            if (magic != self.CACHE_MAGIC or
+                    version != self.CACHE_VERSION or
+                    not 0 < width <= 16 or mtime != source.st_mtime_ns or
+                    size != source.st_size):
+                return None
+
+            offset = header.size + metaSize
+            compositionTable = CompositionTable(width=width)
+            lowSize = 1 << (compositionTable.lowBits + width)
+            highSize = 1 << (2 * width - compositionTable.lowBits)
+            if len(data) not in (offset + 2 * width * width, offset + 2 *
+                                 (width * width + lowSize + highSize)):
+                return None
+
+            meta = json.loads(data[header.size:offset].decode('utf-8'))
+        except (struct.error, ValueError):
+            return None
+
+        tables = [array('H', data[offset:offset + 2 * width * width])]
+        offset += 2 * width * width
+        if len(data) > offset:
+            tables.append(array('H', data[offset:offset + 2 * lowSize]))
+            tables.append(array('H', data[offset + 2 * lowSize:]))
+        if sys.byteorder != 'little':
+            for table in tables:
+                table.byteswap()
+
+        if len(tables) == 1:
+            compositionTable = None
+        else:
+            compositionTable.low, compositionTable.high = tables[1:]
+        return meta, tables[0], compositionTable
+
+    def loadCache(self, cacheFile):
+        """
+        Read a file written by saveCache, keeping its compiled table in
+        cachedCompositionTable. Returns False when it is missing,
+        unreadable or older than the table.
+        """
+
+        cache = self._readCache(cacheFile)
+        if cache is None:
+            return False
+        meta, table, compositionTable = cache
+
+        try:
+            self.setRelations(meta['name'], meta['relations'],
+                              meta['converses'], meta['identity'])
+        except (KeyError, IndexError, TypeError, ValueError):
+            return False
+        width = self.width
+        if len(table) != width * width:
+            return False
+
+        for p in range(width):
+            row = self.basicConstraints[1 << p]
+            for q in range(width):
+                row[1 << q] = table[p * width + q]
+        self.cachedCompositionTable = compositionTable
+        return True
+
+    def loadCompositionTable(self, cacheFile):
+        """
+        The CompositionTable saved in a cache file of this table, or
+        None unless the file is current and holds the same compositions
+        """
+
+        cache = self._readCache(cacheFile)
+        if cache is None or cache[1] != self.basicTable():
+            return None
+        return cache[2]
 
     def storeBasicConstraints(self, constraintFile=None):
 
         self.logger.info('Start to Store basic transitivity constraints')
+        self.basicConstraints.clear()
 
         if constraintFile is None:
             constraintFile = self.transitive_table
 
+        headers = {}
+        compositions = []
         inobj = open(constraintFile, 'r')
 
         for line in inobj:
 
-            if re.search('^\s*$', line):
+            if re.search(r'^\s*(#|$)', line):
+                continue
+
+            if ':' in line and ',' not in line:
+                key, value = line.split(':', 1)
+                headers[key.strip()] = value.split()
                 continue
 
-            fields = line.rstrip().split(',')
+            compositions.append(line.rstrip().split(','))
+
+        inobj.close()
+
+        self.setRelations(headers.get('name', [None])[0],
+                          headers.get('relations'),
+                          headers.get('converses'),
+                          headers.get('identity', [None])[0])
 
-            srcRel = TemporalRelation.RELATION_TO_BIT[fields[0]]
-            trgRel = TemporalRelation.RELATION_TO_BIT[fields[1]]
+        for fields in compositions:
+            srcRel = self.relationToBit[fields[0]]
+            trgRel = self.relationToBit[fields[1]]
             self.basicConstraints[srcRel][
                 trgRel] = self.convToBitRep(fields[2])
 
-        inobj.close()
+        if self.identity is None:
+            self.identity = self._findIdentity()
+
         self.logger.info('Finish storing basic transitivity constraints')
         return
 
+    def setRelations(self, name=None, relations=None, converses=None,
+                     identity=None):
+        """
+        Assign bits to the basic relations, 1 << n to the nth, and
+        build the converse table; the Allen relations by default
+        """
+
+        if relations is None:
+            basicRelations = TemporalRelation.BASIC_RELATIONS
+            self.name = name or 'allen'
+            self.relationNames = [symbol for _, _, symbol, _ in
+                                  basicRelations]
+            self.relationToBit = dict(TemporalRelation.RELATION_TO_BIT)
+            self.width = len(basicRelations)
+            self.universal = TemporalRelation.ALL
+            self.identity = TemporalRelation.EQUAL
+            self.converse = TemporalRelation.INVERSE
+            self.allen = True
+            return
+
+        if converses is None or sorted(converses) != sorted(relations):
+            raise ValueError('The converses of {} do not match its '
+                             'relations'.format(self.transitive_table))
+
+        self.name = name or os.path.splitext(
+            os.path.basename(self.transitive_table))[0]
+        self.relationNames = list(relations)
+        self.relationToBit = dict((symbol, 1 << n)
+                                  for n, symbol in enumerate(relations))
+        self.width = len(relations)
+        self.universal = (1 << self.width) - 1
+        self.relationToBit['all'] = self.universal
+        self.identity = self.relationToBit[identity] if identity else None
+        self.allen = False
+
+        converse = array('H', bytes(2 * (self.universal + 1)))
+        for n, symbol in enumerate(converses):
+            converse[1 << n] = self.relationToBit[symbol]
+        for relations in range(1, self.universal + 1):
+            lowestBit = relations & -relations
+            converse[relations] = converse[relations ^ lowestBit] | \
+                converse[lowestBit]
+        self.converse = converse
+
+    def _findIdentity(self):
+
+        for n in range(self.width):
+            bit = 1 << n
+            if all(self.basicConstraints[bit].get(1 << m) == 1 << m
+                   for m in range(self.width)):
+                return bit
+        raise ValueError('No identity relation in {}'.format(
+            self.transitive_table))
+
     def convToBitRep(self, rel):
 
         fields = rel.split()
@@ -411,41 +2202,30 @@ class TransitiveConstraints:
 
         for indRel in fields:
 
-            bitRepr |= TemporalRelation.RELATION_TO_BIT[indRel]
+            bitRepr |= self.relationToBit[indRel]
 
         return bitRepr
 
+    def relationToString(self, relations):
+
+        return ' '.join(symbol for n, symbol in enumerate(self.relationNames)
+                        if relations & (1 << n))
+
+    def relationFromString(self, relationStr):
+
+        try:
+            return self.convToBitRep(relationStr.replace(',', ' '))
+        except KeyError as exc:
+            raise ValueError('Undefined relation: {}'.format(exc.args[0]))
+
+    @staticmethod
     def convRelToBinary(rel):
 
-        if '<' == rel:
-            return TemporalRelation.BEFORE
-        elif '>' == rel:
-            return TemporalRelation.AFTER
-        elif 'd' == rel:
-            return TemporalRelation.DURING
-        elif 'di' == rel:
-            return TemporalRelation.DURING_BY
-        elif 'o' == rel:
-            return TemporalRelation.OVERLAP
-        elif 'oi' == rel:
-            return TemporalRelation.OVERLAP_BY
-        elif 'm' == rel:
-            return TemporalRelation.MEETS
-        elif 'mi' == rel:
-            return TemporalRelation.MEET_BY
-        elif 's' == rel:
-            return TemporalRelation.STARTS
-        elif 'si' == rel:
-            return TemporalRelation.STARTED_BY
-        elif 'f' == rel:
-            return TemporalRelation.FINISHES
-        elif 'fi' == rel:
-            return TemporalRelation.FINISHED_BY
-        elif '=' == rel:
-            return TemporalRelation.EQUAL
-        else:
+        if rel == 'all' or rel not in TemporalRelation.RELATION_TO_BIT:
             raise ValueError('Undefined relation: {}'.format(rel))
 
+        return TemporalRelation.RELATION_TO_BIT[rel]
+
     def getBasicRels(self):
 
         return sorted(self.basicConstraints.keys())
@@ -496,3 +2276,155 @@ class TransitiveConstraints:
 
     #             self.looger.debug(' '.join(relSet1) + \
                                   # ',' + ' '.join(relSet2))
+
+
+class CompositionTable:
+
+    """
+    Composes two disjunctive relations with two array lookups.
+
+    Composition distributes over union, so the first relation is split
+    into a low and a high half of its bits and the composition of every
+    possible half with every possible second relation is precomputed.
+    For the 13 Allen relations this is 192 rows of 8192 entries (3MB)
+    instead of a full 8192x8192 table.
+    """
+
+    def __init__(self, basicConstraints=None, width=13):
+
+        self.logger = logging.getLogger('CompositionTable')
+        if width > 16:
+            raise ValueError('Relations wider than 16 bits: {}'.format(width))
+        self.width = width
+        self.lowBits = (width + 1) // 2
+        self.lowMask = (1 << self.lowBits) - 1
+        self.low = None
+        self.high = None
+        self._numpyTables = None
+        if basicConstraints is not None:
+            self.build(basicConstraints)
+
+    def build(self, basicConstraints):
+
+        self.logger.info('Start to build composition table')
+        size = 1 << self.width
+
+        # rows[p][s] is the composition of basic relation 1 << p with s
+        rows = []
+        for p in range(self.width):
+            basicRow = basicConstraints.get(1 << p, {})
+            row = array('H', bytes(2 * size))
+            for s in range(1, size):
+                lowestBit = s & -s
+                row[s] = row[s ^ lowestBit] | basicRow.get(lowestBit, 0)
+            rows.append(row)
+
+        self.low = self._buildHalf(rows[:self.lowBits], size)
+        self.high = self._buildHalf(rows[self.lowBits:], size)
+        self.logger.info('Finish building composition table')
+
+    @staticmethod
+    def _buildHalf(rows, size):
+
+        table = [array('H', bytes(2 * size))]
+        for r in range(1, 1 << len(rows)):
+            lowestBit = r & -r
+            table.append(array('H', map(
+                operator.or_, table[r ^ lowestBit],
+                rows[lowestBit.bit_length() - 1])))
+
+        flat = array('H')
+        for row in table:
+            flat.extend(row)
+        return flat
+
+    def compose(self, rel1, rel2):
+
+        width = self.width
+        return (self.low[((rel1 & self.lowMask) << width) | rel2] |
+                self.high[((rel1 >> self.lowBits) << width) | rel2])
+
+    def numpyTables(self):
+        """
+        The low and high halves as 2D NumPy arrays indexed by
+        [half of the first relation, second relation]
+        """
+
+        if self._numpyTables is None:
+            self._numpyTables = (
+                np.frombuffer(self.low, dtype=np.uint16).reshape(
+                    1 << self.lowBits, 1 << self.width),
+                np.frombuffer(self.high, dtype=np.uint16).reshape(
+                    1 << (self.width - self.lowBits), 1 << self.width))
+        return self._numpyTables
+
+
+# the shared tables of the process, keyed by (real path, mtime) of
+# their table file and guarded by _tablesLock
+_transitiveConstraints = {}
+_compositionTables = {}
+_tablesLock = threading.Lock()
+
+TABLE_CACHE_SUFFIX = '.bin'
+
+
+def _tableKey(transitive_table):
+
+    path = os.path.realpath(transitive_table)
+    return path, os.stat(path).st_mtime_ns
+
+
+def loadTransitiveConstraints(transitive_table=DEFAULT_TRANSITIVE_TABLE,
+                              sidecar=True):
+    """
+    Return the TransitiveConstraints of a table file, parsed once per
+    process and version of the file and shared by every caller. This is
+    safe to call from several threads.
+
+    With sidecar, the parsed table is also kept in a binary file next
+    to the table file (its path plus TABLE_CACHE_SUFFIX), which later
+    processes load instead of parsing the text.
+    """
+
+    key = _tableKey(transitive_table)
+    with _tablesLock:
+        constraints = _transitiveConstraints.get(key)
+        if constraints is None:
+            cacheFile = key[0] + TABLE_CACHE_SUFFIX if sidecar else None
+            constraints = TransitiveConstraints(transitive_table, cacheFile)
+            _transitiveConstraints[key] = constraints
+    return constraints
+
+
+def getCompositionTable(constraints, cacheFile=None):
+    """
+    Return the CompositionTable of a TransitiveConstraints instance.
+
+    Tables are shared by every network of the process that uses the
+    same version of a transitive table file. The compiled table is
+    kept in the sidecar of the TransitiveConstraints, or in cacheFile
+    when it is given: it is read from there when the file is current
+    and was saved for the same compositions, and rebuilt and written
+    to it otherwise.
+    """
+
+    key = _tableKey(constraints.transitive_table)
+    with _tablesLock:
+        table = _compositionTables.get(key)
+
+        if table is None:
+            if cacheFile is None:
+                cacheFile = constraints.cacheFile
+                table = constraints.cachedCompositionTable
+            else:
+                table = constraints.loadCompositionTable(cacheFile)
+            constraints.cachedCompositionTable = None
+
+            if table is None:
+                table = CompositionTable(constraints.basicConstraints,
+                                         constraints.width)
+                if cacheFile is not None:
+                    constraints.saveCache(cacheFile, table)
+            _compositionTables[key] = table
+
+    return table
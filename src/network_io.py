@@ -0,0 +1,249 @@
+import sys
+import json
+import mmap
+import struct
+import logging
+from array import array
+from bisect import bisect_left
+
+from make_temp_rel_const_table import (ConstraintNetwork, NetworkDictView,
+                                       Node, NodeRegistry, TemporalRelation)
+
+# create logger
+module_logger = logging.getLogger('network_io')
+
+MAGIC = b'TNET'
+VERSION = 1
+DENSE = 0
+SPARSE = 1
+FLAG_CLOSED = 1
+
+# magic, version, layout, flags, node count, id table bytes, edge count
+HEADER = struct.Struct('<4sHHIQQQ')
+
+
+def _padding(size):
+
+    return -size % 8
+
+
+def _littleEndian(values):
+
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+def saveNetwork(network, path, layout=None):
+    """
+    Write a ConstraintNetwork as a node id table followed by either a
+    dense uint16 relation matrix or a CSR edge list of the relations
+    that are not ALL. The layout defaults to whichever is smaller.
+
+        header | JSON list of node ids | padding |
+        DENSE:  n * n uint16 relations, row major
+        SPARSE: (n + 1) uint32 row offsets | m uint32 columns |
+                m uint16 relations
+
+    Node ids must be JSON serializable (TimeML ids, numbers), and the
+    relations must be Allen relations.
+    """
+
+    if not network.constraintCalculator.allen:
+        raise ValueError('Only networks of Allen relations can be saved')
+
+    size = len(network.nodeList)
+    rows = [[] for _ in range(size)]
+    for i, j, relation in network.store.relations():
+        rows[i].append((j, relation))
+    edgeCount = sum(len(row) for row in rows)
+
+    if layout is None:
+        layout = SPARSE if 6 * edgeCount < 2 * size * size else DENSE
+
+    idTable = json.dumps(
+        [node.nodeID for node in network.nodeList]).encode('utf-8')
+    flags = FLAG_CLOSED if network.closed else 0
+
+    with open(path, 'wb') as outobj:
+        outobj.write(HEADER.pack(MAGIC, VERSION, layout, flags, size,
+                                 len(idTable), edgeCount))
+        outobj.write(idTable)
+        outobj.write(bytes(_padding(HEADER.size + len(idTable))))
+
+        if layout == DENSE:
+            matrix = array('H', [TemporalRelation.ALL]) * (size * size)
+            for i, row in enumerate(rows):
+                matrix[i * size + i] = TemporalRelation.EQUAL
+                for j, relation in row:
+                    matrix[i * size + j] = relation
+            _littleEndian(matrix).tofile(outobj)
+
+        else:
+            offsets = array('I', [0])
+            columns = array('I')
+            relations = array('H')
+            for row in rows:
+                row.sort()
+                columns.extend(j for j, _ in row)
+                relations.extend(relation for _, relation in row)
+                offsets.append(len(columns))
+            _littleEndian(offsets).tofile(outobj)
+            _littleEndian(columns).tofile(outobj)
+            _littleEndian(relations).tofile(outobj)
+
+
+class _NodeIDIndex(dict):
+
+    """Node id to index map that also accepts Node objects as keys."""
+
+    def __missing__(self, key):
+
+        if isinstance(key, Node):
+            return self[key.nodeID]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+
+        if isinstance(key, Node):
+            key = key.nodeID
+        return dict.__contains__(self, key)
+
+
+class MappedNetwork:
+
+    """
+    Read-only view of a file written by saveNetwork, memory mapped so
+    that only the node id table is deserialized. Relations are read
+    from the mapping on demand with relation(a, b) or
+    networkDict[a][b].relation, where a and b are node ids or Nodes.
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0,
+                               access=mmap.ACCESS_READ)
+
+        (magic, version, self.layout, flags, size, idTableSize,
+         self.edgeCount) = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('Not a network file: {}'.format(path))
+
+        self.closed = bool(flags & FLAG_CLOSED)
+        offset = HEADER.size
+        self.nodeList = json.loads(
+            self._mmap[offset:offset + idTableSize].decode('utf-8'))
+        self.nodeIndex = _NodeIDIndex(
+            (nodeID, i) for i, nodeID in enumerate(self.nodeList))
+        offset += idTableSize + _padding(offset + idTableSize)
+
+        buffer = memoryview(self._mmap)
+        if self.layout == DENSE:
+            self.matrix = self._view(buffer, offset, 'H', size * size)
+        else:
+            self.offsets = self._view(buffer, offset, 'I', size + 1)
+            offset += 4 * (size + 1)
+            self.columns = self._view(buffer, offset, 'I', self.edgeCount)
+            offset += 4 * self.edgeCount
+            self.relations = self._view(buffer, offset, 'H',
+                                        self.edgeCount)
+        buffer.release()
+
+        self.networkDict = NetworkDictView(self)
+
+    @staticmethod
+    def _view(buffer, offset, typecode, count):
+
+        itemSize = array(typecode).itemsize
+        view = buffer[offset:offset + itemSize * count].cast(typecode)
+        if sys.byteorder != 'little':
+            values = array(typecode, view)
+            view.release()
+            values.byteswap()
+            return values
+        return view
+
+    def __len__(self):
+
+        return len(self.nodeList)
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *excInfo):
+
+        self.close()
+
+    def get(self, i, j):
+
+        if self.layout == DENSE:
+            return self.matrix[i * len(self.nodeList) + j]
+
+        # the edge list has no diagonal
+        if i == j:
+            return TemporalRelation.EQUAL
+
+        start = self.offsets[i]
+        end = self.offsets[i + 1]
+        position = bisect_left(self.columns, j, start, end)
+        if position < end and self.columns[position] == j:
+            return self.relations[position]
+        return TemporalRelation.ALL
+
+    def set(self, i, j, relation):
+
+        raise TypeError('{} is read-only'.format(self.path))
+
+    def relation(self, source, destination):
+
+        return self.get(self.nodeIndex[source], self.nodeIndex[destination])
+
+    def close(self):
+
+        for name in ('matrix', 'offsets', 'columns', 'relations'):
+            view = self.__dict__.pop(name, None)
+            if isinstance(view, memoryview):
+                view.release()
+        self._mmap.close()
+        self._file.close()
+
+
+def loadNetwork(path, **networkArgs):
+    """
+    Read a file written by saveNetwork back into a ConstraintNetwork
+    with a Node per node id. networkArgs are passed to
+    ConstraintNetwork.
+    """
+
+    network = ConstraintNetwork(**networkArgs)
+
+    with MappedNetwork(path) as mapped:
+        for node in NodeRegistry(mapped.nodeList):
+            network.addDefaultLinks(node)
+            network.nodes.add(node)
+
+        set_ = network.store.set
+        size = len(mapped.nodeList)
+        if mapped.layout == DENSE:
+            for i in range(size):
+                for j in range(size):
+                    relation = mapped.matrix[i * size + j]
+                    if relation != TemporalRelation.ALL and i != j:
+                        set_(i, j, relation)
+        else:
+            for i in range(size):
+                for position in range(mapped.offsets[i],
+                                      mapped.offsets[i + 1]):
+                    set_(i, mapped.columns[position],
+                         mapped.relations[position])
+
+        network.closed = mapped.closed
+        network.version += 1
+        network.supportsIncomplete = True
+
+    return network
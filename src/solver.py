@@ -0,0 +1,315 @@
+import logging
+
+from make_temp_rel_const_table import TemporalRelation, relationSubclass
+
+# create logger
+module_logger = logging.getLogger('solver')
+
+
+def _size(relations):
+
+    return bin(relations).count('1')
+
+
+class Solver:
+
+    """
+    Exact reasoning over a ConstraintNetwork of Allen relations.
+
+    Path consistency alone does not decide consistency of general
+    disjunctive networks, but it does for networks whose relations all
+    belong to the ORD-Horn subclass. The solver therefore backtracks
+    over relations outside the subclass, splitting each one into a
+    cover of maximal subclass relations and running path consistency
+    after every choice, so that it only branches on the few relations
+    that are not tractable. Scenarios are completed greedily inside
+    such a tractable network, where every choice that survives
+    propagation is known to be consistent.
+
+    The network is modified in place during search and restored
+    through the trail of ConstraintNetwork.propagate, except by
+    minimalNetwork, which keeps its narrowed relations.
+
+    heuristic selects the next relation to split:
+        'static'    the first one in node order
+        'smallest'  the one with the fewest alternatives (default)
+        'degree'    the one between the most constrained nodes
+    """
+
+    HEURISTICS = ('static', 'smallest', 'degree')
+
+    def __init__(self, network, subclass='ord-horn', heuristic='smallest'):
+
+        if not network.constraintCalculator.allen:
+            raise ValueError('The solver needs a network of Allen relations')
+        if heuristic not in self.HEURISTICS:
+            raise ValueError('Undefined heuristic: {}'.format(heuristic))
+
+        self.logger = logging.getLogger('Solver')
+        self.network = network
+        self.membership = relationSubclass(subclass)
+        self.heuristic = heuristic
+        self.subclassRelations = sorted(
+            (relations for relations in range(1, TemporalRelation.ALL + 1)
+             if self.membership[relations]), key=_size, reverse=True)
+        self._splits = {}
+        self.searchNodes = 0
+
+    def splits(self, relations):
+        """
+        A cover of relations by maximal subclass relations, largest
+        first; relations themselves when they are in the subclass
+        """
+
+        if self.membership[relations]:
+            return [relations]
+
+        cover = self._splits.get(relations)
+        if cover is None:
+            candidates = [subRel for subRel in self.subclassRelations
+                          if subRel & relations == subRel]
+            maximal = [subRel for n, subRel in enumerate(candidates)
+                       if not any(other & subRel == subRel
+                                  for other in candidates[:n])]
+
+            cover = []
+            uncovered = relations
+            while uncovered:
+                best = max(maximal, key=lambda subRel: _size(subRel &
+                                                             uncovered))
+                cover.append(best)
+                uncovered &= ~best
+            self._splits[relations] = cover
+
+        return cover
+
+    def _basicRelations(self, relations):
+
+        return [bit for bit, _, _, _ in TemporalRelation.BASIC_RELATIONS
+                if bit & relations]
+
+    def _allPairs(self):
+
+        size = len(self.network.nodeList)
+        return ((i, j) for i in range(size) for j in range(i + 1, size))
+
+    def _degrees(self):
+
+        degrees = [0] * len(self.network.nodeList)
+        for i, j, relations in self.network.store.relations():
+            degrees[i] += 1
+        return degrees
+
+    def _selector(self, pairs, isOpen, alternatives):
+        """Build the function returning the next open pair or None."""
+
+        get = self.network.store.get
+
+        if self.heuristic == 'static':
+            def select():
+                for i, j in pairs():
+                    if isOpen(get(i, j)):
+                        return i, j
+                return None
+
+        elif self.heuristic == 'smallest':
+            def select():
+                best = None
+                bestScore = None
+                for i, j in pairs():
+                    relations = get(i, j)
+                    if isOpen(relations):
+                        score = (alternatives(relations), _size(relations))
+                        if bestScore is None or score < bestScore:
+                            best, bestScore = (i, j), score
+                return best
+
+        else:
+            degrees = self._degrees()
+
+            def select():
+                best = None
+                bestScore = None
+                for i, j in pairs():
+                    relations = get(i, j)
+                    if isOpen(relations):
+                        score = (-degrees[i] - degrees[j],
+                                 alternatives(relations))
+                        if bestScore is None or score < bestScore:
+                            best, bestScore = (i, j), score
+                return best
+
+        return select
+
+    def _assign(self, pair, relations, trail):
+
+        i, j = pair
+        store = self.network.store
+        trail.append((i, j, store.get(i, j)))
+        trail.append((j, i, store.get(j, i)))
+        store.set(i, j, relations)
+        store.set(j, i, TemporalRelation.INVERSE[relations])
+        return self.network.propagate([pair], trail)
+
+    def _search(self, select, branches, onLeaf):
+        """
+        Depth-first search assigning branches(pair) to the pairs chosen
+        by select until it returns None, where onLeaf is called; stops
+        as soon as onLeaf returns True. The network is restored before
+        returning.
+        """
+
+        rollback = self.network.rollback
+
+        pair = select()
+        if pair is None:
+            return onLeaf()
+
+        stack = [(pair, iter(branches(pair)))]
+        trails = []
+        while stack:
+            pair, alternatives = stack[-1]
+            if len(trails) == len(stack):
+                rollback(trails.pop())
+
+            for relations in alternatives:
+                self.searchNodes += 1
+                trail = []
+                if not self._assign(pair, relations, trail):
+                    rollback(trail)
+                    continue
+
+                nextPair = select()
+                if nextPair is None:
+                    stop = onLeaf()
+                    rollback(trail)
+                    if stop:
+                        for trail in reversed(trails):
+                            rollback(trail)
+                        return True
+                    continue
+
+                trails.append(trail)
+                stack.append((nextPair, iter(branches(nextPair))))
+                break
+            else:
+                stack.pop()
+
+        return False
+
+    def _close(self):
+
+        return self.network.isConsistent()
+
+    def isConsistent(self):
+        """Decide consistency of the network exactly."""
+
+        if not self._close():
+            return False
+
+        membership = self.membership
+        select = self._selector(self.network.store.pairs,
+                                lambda relations: not membership[relations],
+                                lambda relations: len(self.splits(relations)))
+        get = self.network.store.get
+        return self._search(select, lambda pair: self.splits(get(*pair)),
+                            lambda: True)
+
+    def scenario(self):
+        """
+        One consistent scenario as a dict mapping every (nodeA, nodeB)
+        pair, in node order, to a basic relation, or None when the
+        network is inconsistent
+        """
+
+        if not self._close():
+            return None
+
+        membership = self.membership
+        network = self.network
+        get = network.store.get
+        nodeList = network.nodeList
+        select = self._selector(network.store.pairs,
+                                lambda relations: not membership[relations],
+                                lambda relations: len(self.splits(relations)))
+        found = {}
+
+        def onLeaf():
+            # the network is now path consistent with every relation in
+            # the subclass, so path consistency decides each choice
+            trail = []
+            for i, j in self._allPairs():
+                relations = get(i, j)
+                if relations & (relations - 1):
+                    for basicRel in self._basicRelations(relations):
+                        mark = len(trail)
+                        if self._assign((i, j), basicRel, trail):
+                            break
+                        network.rollback(trail[mark:])
+                        del trail[mark:]
+                    else:
+                        network.rollback(trail)
+                        return False
+                found[(nodeList[i], nodeList[j])] = get(i, j)
+
+            network.rollback(trail)
+            return True
+
+        if self._search(select, lambda pair: self.splits(get(*pair)),
+                        onLeaf):
+            return found
+        return None
+
+    def countScenarios(self, limit=None):
+        """
+        Count the consistent scenarios of the network, stopping at limit
+        when it is given
+        """
+
+        if not self._close():
+            return 0
+
+        get = self.network.store.get
+        select = self._selector(
+            self._allPairs, lambda relations: relations & (relations - 1),
+            _size)
+        count = [0]
+
+        def onLeaf():
+            count[0] += 1
+            return limit is not None and count[0] >= limit
+
+        self._search(select, lambda pair: self._basicRelations(get(*pair)),
+                     onLeaf)
+        return count[0]
+
+    def minimalNetwork(self):
+        """
+        Narrow every relation of the network to the basic relations
+        that occur in some consistent scenario. Returns False, leaving
+        the network closed but unchanged, when it is inconsistent.
+        """
+
+        if not self.isConsistent():
+            return False
+
+        store = self.network.store
+        for i, j in self._allPairs():
+            relations = store.get(i, j)
+            minimal = 0
+
+            for basicRel in self._basicRelations(relations):
+                trail = []
+                if self._assign((i, j), basicRel, trail) and \
+                        self.isConsistent():
+                    minimal |= basicRel
+                self.network.rollback(trail)
+
+            if minimal != relations:
+                store.set(i, j, minimal)
+                store.set(j, i, TemporalRelation.INVERSE[minimal])
+                self.network.version += 1
+                self.network.supportsIncomplete = True
+                self.network.propagate([(i, j)])
+
+        return True
@@ -1,5 +1,27 @@
+import gc
+import io
+import os
+import random
+import asyncio
+import tempfile
 import unittest
+import xml.etree.ElementTree as ET
 from make_temp_rel_const_table import *
+import batch_closure
+import timeml_loader
+import network_io
+import benchmark
+import closure_service
+from benchmark import randomLinks
+from solver import Solver
+
+
+def closedRelations(network, nodes):
+
+    return [[network.networkDict[nodeI][nodeJ].relation
+             for nodeJ in nodes if nodeJ is not nodeI
+             and nodeJ in network.nodes]
+            for nodeI in nodes if nodeI in network.nodes]
 
 
 class TestConstraintNetwork(unittest.TestCase):
@@ -21,6 +43,24 @@ class TestConstraintNetwork(unittest.TestCase):
 
         self.assertEqual(len(pairs), 10, 'Incorrect size of generated pairs')
 
+    def test_nodeRegistry(self):
+
+        registry = NodeRegistry(['e1', 't1'])
+        node = registry.get('e2')
+
+        self.assertIs(registry['e1'], registry.get('e1'))
+        self.assertIs(registry.get('e2'), node)
+        self.assertEqual([node.index for node in registry], [0, 1, 2])
+        self.assertEqual(len(registry), 3)
+        self.assertIn('t1', registry)
+        self.assertFalse(hasattr(node, '__dict__'))
+
+        first = Node()
+        second = Node()
+        self.assertNotEqual(first.nodeID, second.nodeID)
+        self.assertEqual(int(second.nodeID.split('-')[1]),
+                         int(first.nodeID.split('-')[1]) + 1)
+
     def test_convToBitRep(self):
 
         transConstraints = TransitiveConstraints(self.transitive_table)
@@ -76,6 +116,44 @@ class TestConstraintNetwork(unittest.TestCase):
         self.assertEqual(inversedRel & TemporalRelation.MEETS, 0)
         self.assertNotEqual(inversedRel & TemporalRelation.MEET_BY, 0)
 
+        self.assertEqual(TemporalRelation.inverse(TemporalRelation.OVERLAP_BY),
+                         TemporalRelation.OVERLAP)
+        self.assertEqual(TemporalRelation.inverse(TemporalRelation.ALL),
+                         TemporalRelation.ALL)
+
+    def test_relationTables(self):
+
+        self.assertEqual(
+            TemporalRelation.relationToString(TemporalRelation.BEFORE |
+                                              TemporalRelation.MEET_BY |
+                                              TemporalRelation.DURING),
+            'before,during,meet_by')
+        self.assertEqual(TemporalRelation.relationToString(0), '')
+
+        table = ConstraintNetwork().compositionTable
+        for relations in range(TemporalRelation.ALL + 1):
+            inverseRel = TemporalRelation.inverse(relations)
+            self.assertEqual(TemporalRelation.inverse(inverseRel), relations)
+            self.assertEqual(bin(inverseRel).count('1'),
+                             bin(relations).count('1'))
+            self.assertEqual(TemporalRelation.relationFromString(
+                TemporalRelation.relationToString(relations)), relations)
+
+        rand = random.Random(11)
+        for _ in range(200):
+            rel1 = rand.randint(1, TemporalRelation.ALL)
+            rel2 = rand.randint(1, TemporalRelation.ALL)
+            self.assertEqual(
+                TemporalRelation.inverse(table.compose(rel1, rel2)),
+                table.compose(TemporalRelation.inverse(rel2),
+                              TemporalRelation.inverse(rel1)))
+
+        self.assertEqual(TemporalRelation.relationFromString('< m, equal'),
+                         TemporalRelation.BEFORE | TemporalRelation.MEETS |
+                         TemporalRelation.EQUAL)
+        self.assertRaises(ValueError, TemporalRelation.relationFromString,
+                          'sometime')
+
     def test_isConsisten(self):
 
         nodeI = Node()
@@ -122,6 +200,1021 @@ class TestConstraintNetwork(unittest.TestCase):
                          TemporalRelation.BEFORE | TemporalRelation.MEETS,
                          msg)
 
+    def test_touchedPairs(self):
+
+        nodes = [Node(i) for i in range(6)]
+        network = ConstraintNetwork()
+        for nodeI, nodeJ in zip(nodes, nodes[1:]):
+            network.add(Link(nodeI, nodeJ, set([TemporalRelation.BEFORE,
+                                                TemporalRelation.MEETS])))
+        self.assertTrue(network.isConsistent())
+        self.assertEqual(network.touchedPairs, set())
+
+        network.add(Link(nodes[1], nodes[2], set([TemporalRelation.BEFORE])))
+        self.assertEqual(len(network.touchedPairs), 1)
+        self.assertTrue(network.isConsistent())
+        self.assertEqual(network.networkDict[nodes[0]][nodes[3]].relation,
+                         TemporalRelation.BEFORE)
+
+        network.add(Link(nodes[5], nodes[0], set([TemporalRelation.BEFORE])))
+        self.assertFalse(network.isConsistent())
+
+        # a contradictory add on a closed network of two nodes
+        for storage in ('links', 'sparse'):
+            nodes = [Node(i) for i in range(2)]
+            before = set([TemporalRelation.BEFORE])
+            network = ConstraintNetwork(storage=storage)
+            network.add(Link(nodes[0], nodes[1], before))
+            self.assertTrue(network.isConsistent())
+            network.add(Link(nodes[1], nodes[0], before))
+            self.assertFalse(network.isConsistent())
+
+    def test_components(self):
+
+        network = ConstraintNetwork()
+        before = set([TemporalRelation.BEFORE])
+        nodes = [Node(i) for i in range(7)]
+        network.add(Link(nodes[0], nodes[1], before))
+        network.add(Link(nodes[4], nodes[5], before))
+        network.add(Link(nodes[1], nodes[2], before))
+        network.addDefaultLinks(nodes[6])
+        network.nodes.add(nodes[6])
+
+        self.assertEqual(network.components(),
+                         [([0, 1, 4], [(0, 1), (1, 4)]),
+                          ([2, 3], [(2, 3)])])
+        self.assertTrue(network.isConsistent())
+        self.assertEqual(network.networkDict[nodes[0]][nodes[2]].relation,
+                         TemporalRelation.BEFORE)
+        self.assertEqual(network.networkDict[nodes[0]][nodes[4]].relation,
+                         TemporalRelation.ALL)
+
+    def test_relationQueries(self):
+
+        nodes = [Node(i) for i in range(4)]
+        before = set([TemporalRelation.BEFORE])
+        network = ConstraintNetwork(storage='matrix')
+        network.add(Link(nodes[0], nodes[1], before))
+        network.add(Link(nodes[1], nodes[2], before))
+
+        self.assertEqual(network.relation(nodes[0], nodes[2]),
+                         TemporalRelation.BEFORE)
+        self.assertTrue(network.closed)
+        version = network.version
+        network.add(Link(nodes[0], nodes[2], before))
+        self.assertEqual(network.version, version)
+
+        network.add(Link(nodes[2], nodes[3], set([TemporalRelation.MEETS])))
+        self.assertEqual(
+            network.relations([(nodes[3], nodes[0]), (nodes[1], nodes[1])]),
+            [TemporalRelation.AFTER, TemporalRelation.EQUAL])
+
+        network.add(Link(nodes[3], nodes[0], before))
+        self.assertEqual(network.relation(nodes[0], nodes[3]), 0)
+        self.assertRaises(KeyError, network.relation, nodes[0], Node())
+
+    def test_propagationStats(self):
+
+        nodes, links = randomLinks(8, 14, 3)
+        network = ConstraintNetwork(profile=True)
+        plain = ConstraintNetwork()
+        for link in links:
+            network.add(link)
+            plain.add(link)
+
+        with self.assertLogs('ConstraintNetwork', 'INFO') as logs:
+            self.assertTrue(network.isConsistent())
+        self.assertTrue(plain.isConsistent())
+        self.assertIsNone(plain.stats)
+        self.assertEqual(closedRelations(network, nodes),
+                         closedRelations(plain, nodes))
+
+        stats = network.stats.asDict()
+        self.assertEqual(stats['calls'], 1)
+        self.assertEqual(stats['pushes'], stats['pops'])
+        self.assertGreater(stats['compositions'], 0)
+        self.assertEqual(stats['lookups'], 2 * stats['compositions'])
+        self.assertLessEqual(stats['maxRevisions'], stats['revisions'])
+        self.assertEqual(set(stats['phases']),
+                         set(['components', 'propagate']))
+        self.assertIn('"pushes": {}'.format(stats['pushes']),
+                      logs.output[0])
+
+        network.stats.reset()
+        network.calConstraint(TemporalRelation.BEFORE,
+                              TemporalRelation.BEFORE)
+        self.assertEqual(network.stats.compositions, 1)
+
+    def test_incrementalAdd(self):
+
+        nodes = [Node(i) for i in range(4)]
+        network = ConstraintNetwork(incremental=True)
+        for nodeI, nodeJ in zip(nodes, nodes[1:]):
+            self.assertTrue(network.add(
+                Link(nodeI, nodeJ, set([TemporalRelation.BEFORE]))))
+        self.assertEqual(network.networkDict[nodes[0]][nodes[3]].relation,
+                         TemporalRelation.BEFORE)
+
+        before = closedRelations(network, nodes)
+        self.assertFalse(network.add(
+            Link(nodes[3], nodes[0], set([TemporalRelation.DURING,
+                                          TemporalRelation.BEFORE]))))
+        self.assertEqual(closedRelations(network, nodes), before)
+        self.assertTrue(network.isConsistent())
+
+    def test_incrementalMatchesBatch(self):
+
+        rejected = 0
+        for seed in range(10):
+            nodes, links = randomLinks(8, 14, seed, contradictions=2)
+
+            incremental = ConstraintNetwork(incremental=True)
+            accepted = [link for link in links if incremental.add(link)]
+            rejected += len(links) - len(accepted)
+
+            batch = ConstraintNetwork()
+            for link in accepted:
+                batch.add(link)
+            self.assertTrue(batch.isConsistent())
+            self.assertEqual(closedRelations(incremental, nodes),
+                             closedRelations(batch, nodes))
+
+        self.assertGreater(rejected, 0)
+
+    def test_explain(self):
+
+        nodes, links = randomLinks(10, 20, 4)
+        cycle = [Link(nodes[0], nodes[3], set([TemporalRelation.BEFORE])),
+                 Link(nodes[3], nodes[7], set([TemporalRelation.MEETS])),
+                 Link(nodes[7], nodes[0], set([TemporalRelation.OVERLAP]))]
+
+        def consistent(subset):
+            network = ConstraintNetwork()
+            return all(network.add(link) for link in subset) and \
+                network.isConsistent()
+
+        for incremental in (True, False):
+            network = ConstraintNetwork(incremental=incremental,
+                                        explain=True)
+            added = [network.add(link) for link in links + cycle]
+            if incremental:
+                self.assertFalse(added[-1])
+            else:
+                self.assertFalse(network.isConsistent())
+
+            conflict = network.explain()
+            self.assertFalse(consistent(conflict))
+            for n in range(len(conflict)):
+                self.assertTrue(consistent(conflict[:n] + conflict[n + 1:]))
+            self.assertTrue(set(map(id, conflict)) <=
+                            set(map(id, links + cycle)))
+
+        network = ConstraintNetwork(explain=True)
+        for link in links:
+            network.add(link)
+        self.assertTrue(network.isConsistent())
+        self.assertIsNone(network.explain())
+        self.assertRaises(ValueError, ConstraintNetwork().explain)
+
+        # rejected links are not blamed for later rejections
+        for seed in range(20):
+            nodes, links = randomLinks(8, 20, seed, contradictions=6)
+            network = ConstraintNetwork(incremental=True, explain=True)
+            accepted = []
+            for link in links:
+                if network.add(link):
+                    accepted.append(link)
+                    continue
+                conflict = network.explain()
+                self.assertIn(link, conflict)
+                for other in conflict:
+                    self.assertTrue(other is link or other in accepted)
+
+        # relations lifted by closeReduced have no supports
+        nodes = [Node(i) for i in range(3)]
+        before = set([TemporalRelation.BEFORE])
+        network = ConstraintNetwork(explain=True)
+        network.add(Link(nodes[0], nodes[1], before))
+        network.add(Link(nodes[1], nodes[2], before))
+        self.assertTrue(network.closeReduced())
+        self.assertFalse(network.add(Link(nodes[2], nodes[0], before)))
+        self.assertFalse(network.isConsistent())
+        self.assertEqual(len(network.explain()), 3)
+
+    def test_remove(self):
+
+        for explain in (False, True):
+            for incremental in (False, True):
+                nodes, links = randomLinks(10, 18, 6)
+                network = ConstraintNetwork(incremental=incremental,
+                                            explain=explain)
+                for link in links:
+                    self.assertTrue(network.add(link))
+                self.assertTrue(network.isConsistent())
+
+                for link in links[::4]:
+                    network.remove(link)
+                rebuilt = ConstraintNetwork()
+                for link in links:
+                    if link not in links[::4]:
+                        rebuilt.add(link)
+                    else:
+                        for node in (link.source, link.destination):
+                            if node not in rebuilt.nodes:
+                                rebuilt.addDefaultLinks(node)
+                                rebuilt.nodes.add(node)
+
+                self.assertTrue(network.isConsistent())
+                self.assertTrue(rebuilt.isConsistent())
+                self.assertEqual(closedRelations(network, nodes),
+                                 closedRelations(rebuilt, nodes))
+                self.assertRaises(ValueError, network.remove, links[0])
+
+        # relations lifted by closeReduced have no supports
+        for seed in range(20):
+            nodes, links = randomLinks(8, 14, seed)
+            network = ConstraintNetwork(explain=True)
+            for link in links:
+                network.add(link)
+            self.assertTrue(network.closeReduced())
+            self.assertTrue(network.isConsistent())
+
+            network.remove(links[0])
+            rebuilt = ConstraintNetwork()
+            for node in network.nodeList:
+                rebuilt.addDefaultLinks(node)
+                rebuilt.nodes.add(node)
+            for link in links[1:]:
+                rebuilt.add(link)
+            self.assertTrue(network.isConsistent())
+            self.assertTrue(rebuilt.isConsistent())
+            self.assertEqual(closedRelations(network, nodes),
+                             closedRelations(rebuilt, nodes))
+
+        nodes = [Node(i) for i in range(3)]
+        network = ConstraintNetwork(explain=True)
+        cycle = [Link(nodes[0], nodes[1], set([TemporalRelation.BEFORE])),
+                 Link(nodes[1], nodes[2], set([TemporalRelation.BEFORE])),
+                 Link(nodes[2], nodes[0], set([TemporalRelation.BEFORE]))]
+        for link in cycle:
+            network.add(link)
+        self.assertFalse(network.isConsistent())
+        network.remove(cycle[2])
+        self.assertTrue(network.isConsistent())
+        self.assertEqual(network.relation(nodes[0], nodes[2]),
+                         TemporalRelation.BEFORE)
+
+    def test_timeline(self):
+
+        def checkTimeline(network, links):
+            endpoints = {}
+            positions = []
+            for position, node, endpoint in network.timeline():
+                endpoints.setdefault(node, [None, None])[endpoint] = position
+                positions.append(position)
+            self.assertEqual(positions, sorted(positions))
+            self.assertEqual(len(endpoints), len(network.nodes))
+            for link in links:
+                relation = TemporalRelation.intervalRelation(
+                    endpoints[link.source], endpoints[link.destination])
+                self.assertTrue(relation & link.relation)
+
+        # basic relations between random intervals are pointisable
+        rand = random.Random(1)
+        nodes = [Node(i) for i in range(30)]
+        intervals = []
+        for _ in nodes:
+            start = rand.randint(0, 20)
+            intervals.append((start, start + rand.randint(1, 5)))
+        links = []
+        for _ in range(40):
+            i, j = rand.sample(range(len(nodes)), 2)
+            links.append(Link(nodes[i], nodes[j], set(
+                [TemporalRelation.intervalRelation(intervals[i],
+                                                   intervals[j])])))
+        network = ConstraintNetwork(storage='sparse')
+        for link in links:
+            network.add(link)
+        self.assertTrue(network.isPointisable())
+        checkTimeline(network, links)
+
+        other = TemporalRelation.AFTER if links[0].relation == \
+            TemporalRelation.BEFORE else TemporalRelation.BEFORE
+        network.add(Link(links[0].source, links[0].destination,
+                         set([other])))
+        self.assertIsNone(network.timeline())
+
+        # other networks go through a Solver scenario
+        for seed in range(20):
+            nodes, links = randomLinks(8, 12, seed, contradictions=seed % 2)
+            network = ConstraintNetwork()
+            for link in links:
+                network.add(link)
+            if not network.isPointisable():
+                if network.timeline() is None:
+                    self.assertFalse(Solver(network).isConsistent())
+                else:
+                    checkTimeline(network, links)
+
+
+class TestRelationStores(unittest.TestCase):
+
+    def test_matrixStorage(self):
+
+        for seed in range(10):
+            nodes, links = randomLinks(8, 12, seed,
+                                       contradictions=seed % 2)
+            results = []
+
+            for storage in ('links', 'matrix', 'sparse'):
+                network = ConstraintNetwork(storage=storage)
+                for link in links:
+                    network.add(link)
+                if network.isConsistent():
+                    results.append(closedRelations(network, nodes))
+                else:
+                    # the narrowed relations at the point of failure
+                    # depend on the propagation order
+                    results.append(False)
+
+            self.assertEqual(results[0], results[1])
+            self.assertEqual(results[0], results[2])
+
+    def test_networkDictView(self):
+
+        nodeI = Node()
+        nodeJ = Node()
+        network = ConstraintNetwork(storage='matrix')
+        network.add(Link(nodeI, nodeJ, set([TemporalRelation.BEFORE])))
+
+        self.assertEqual(network.networkDict[nodeJ][nodeI].relation,
+                         TemporalRelation.AFTER)
+        network.networkDict[nodeI][nodeJ].relation &= TemporalRelation.ALL
+        self.assertEqual(network.networkDict[nodeI][nodeJ].relation,
+                         TemporalRelation.BEFORE)
+        self.assertNotIn(nodeI, network.networkDict[nodeI])
+
+        for i in range(20):
+            network.add(Link(Node(), nodeJ))
+        self.assertEqual(network.networkDict[nodeI][nodeJ].relation,
+                         TemporalRelation.BEFORE)
+
+    def test_sparseStorage(self):
+
+        nodes = [Node(i) for i in range(50)]
+        network = ConstraintNetwork(storage='sparse')
+        for nodeI, nodeJ in zip(nodes, nodes[1:]):
+            network.add(Link(nodeI, nodeJ, set([TemporalRelation.BEFORE])))
+        network.add(Link(Node(), Node(), set([TemporalRelation.DURING])))
+
+        self.assertEqual(len(list(network.store.pairs())), 50)
+        self.assertTrue(network.isConsistent())
+        self.assertEqual(network.networkDict[nodes[0]][nodes[-1]].relation,
+                         TemporalRelation.BEFORE)
+        self.assertEqual(network.networkDict[nodes[-1]][nodes[0]].relation,
+                         TemporalRelation.AFTER)
+        # the two clusters stay unconstrained and unmaterialized
+        self.assertEqual(
+            sum(len(row) for row in network.store.rows), 50 * 49 + 2)
+
+    @unittest.skipIf(np is None, 'NumPy is not installed')
+    def test_numpyEngine(self):
+
+        for seed in range(10):
+            nodes, links = randomLinks(10, 16, seed,
+                                       contradictions=seed % 2)
+            results = []
+
+            for storage, engine in (('links', 'python'),
+                                    ('links', 'numpy'),
+                                    ('matrix', 'numpy'),
+                                    ('sparse', 'numpy')):
+                network = ConstraintNetwork(storage=storage, engine=engine)
+                for link in links:
+                    network.add(link)
+                if network.isConsistent():
+                    results.append(closedRelations(network, nodes))
+                else:
+                    results.append(False)
+
+            for result in results[1:]:
+                self.assertEqual(results[0], result)
+
+    def test_threadsEngine(self):
+
+        for seed in range(12):
+            nodes, links = randomLinks(10, 18, seed,
+                                       contradictions=seed % 3)
+            results = []
+
+            for engine in ('python', 'threads'):
+                network = ConstraintNetwork(storage='sparse', engine=engine,
+                                            maxWorkers=3)
+                # close once half way so that the second run starts
+                # from the pairs narrowed since then
+                for n, link in enumerate(links):
+                    network.add(link)
+                    if n == len(links) // 2:
+                        network.isConsistent()
+                if network.isConsistent():
+                    results.append(closedRelations(network, nodes))
+                else:
+                    results.append(False)
+
+            self.assertEqual(results[0], results[1])
+
+    def test_pointEngine(self):
+
+        membership = relationSubclass('pointisable')
+        pointisable = [relation for relation in range(TemporalRelation.ALL)
+                       if membership[relation]]
+        rand = random.Random(0)
+
+        for seed in range(200):
+            nodes = [Node(i) for i in range(rand.randint(2, 6))]
+            links = []
+            for _ in range(rand.randint(1, 10)):
+                link = Link(*rand.sample(nodes, 2))
+                link.relation = rand.choice(pointisable[1:])
+                links.append(link)
+
+            network = ConstraintNetwork()
+            points = ConstraintNetwork(storage='sparse', engine='points')
+            added = all([network.add(link) for link in links])
+            for link in links:
+                points.add(link)
+            self.assertTrue(points.isPointisable())
+            self.assertEqual(points.isConsistent(),
+                             added and network.isConsistent())
+
+        # a relation outside the subclass falls back to path consistency
+        nodes = [Node(i) for i in range(3)]
+        points = ConstraintNetwork(engine='points')
+        points.add(Link(nodes[0], nodes[1], set([TemporalRelation.BEFORE])))
+        points.add(Link(nodes[1], nodes[2], set([TemporalRelation.BEFORE])))
+        self.assertTrue(points.isConsistent())
+        self.assertEqual(points.networkDict[nodes[0]][nodes[2]].relation,
+                         TemporalRelation.ALL)
+        points.add(Link(nodes[0], nodes[2], set([TemporalRelation.AFTER,
+                                                 TemporalRelation.MEETS])))
+        self.assertFalse(points.isPointisable())
+        self.assertFalse(points.isConsistent())
+
+
+class TestCompositionTable(unittest.TestCase):
+
+    def setUp(self):
+        self.transitive_table = 'data/transitive_table.txt'
+        self.transConstraints = TransitiveConstraints(self.transitive_table)
+
+    def naiveCompose(self, rel1, rel2):
+
+        basicConstraints = self.transConstraints.basicConstraints
+        derivedRel = 0
+        for rel_i in basicConstraints:
+            for rel_j in basicConstraints[rel_i]:
+                if rel_i & rel1 and rel_j & rel2:
+                    derivedRel |= basicConstraints[rel_i][rel_j]
+        return derivedRel
+
+    def test_compose(self):
+
+        table = CompositionTable(self.transConstraints.basicConstraints)
+        rand = random.Random(7)
+
+        for _ in range(500):
+            rel1 = rand.randint(0, TemporalRelation.ALL)
+            rel2 = rand.randint(0, TemporalRelation.ALL)
+            self.assertEqual(table.compose(rel1, rel2),
+                             self.naiveCompose(rel1, rel2))
+
+        self.assertEqual(table.compose(TemporalRelation.BEFORE,
+                                       TemporalRelation.BEFORE),
+                         TemporalRelation.BEFORE)
+        self.assertEqual(table.compose(0, TemporalRelation.ALL), 0)
+
+    def test_cacheFile(self):
+
+        table = CompositionTable(self.transConstraints.basicConstraints)
+        with tempfile.TemporaryDirectory() as tmpDir:
+            cacheFile = os.path.join(tmpDir, 'composition.bin')
+            self.transConstraints.saveCache(cacheFile, table)
+            meta, basicTable, loaded = self.transConstraints._readCache(
+                cacheFile)
+            self.assertEqual(basicTable, self.transConstraints.basicTable())
+            self.assertEqual(loaded.low, table.low)
+            self.assertEqual(loaded.high, table.high)
+
+            # a cache of another calculus or table version is rebuilt
+            self.assertIsNone(TransitiveConstraints(
+                CALCULI['point'])._readCache(cacheFile))
+            # a fresh copy, so that the process registry has no table
+            tableFile = os.path.join(tmpDir, 'rcc8.txt')
+            with open(CALCULI['rcc8']) as inobj, \
+                    open(tableFile, 'w') as outobj:
+                outobj.write(inobj.read())
+            constraints = TransitiveConstraints(tableFile)
+            self.assertIsNone(constraints.loadCompositionTable(cacheFile))
+            rcc8 = getCompositionTable(constraints, cacheFile)
+            dc = constraints.relationFromString('DC')
+            self.assertEqual(rcc8.width, 8)
+            self.assertEqual(rcc8.compose(dc, dc), constraints.universal)
+            self.assertEqual(constraints.loadCompositionTable(
+                cacheFile).low, rcc8.low)
+            allen = TransitiveConstraints(self.transitive_table)
+            self.assertIsNone(allen.loadCompositionTable(cacheFile))
+
+    def test_sharedTable(self):
+
+        network1 = ConstraintNetwork()
+        network2 = ConstraintNetwork()
+        self.assertIs(network1.compositionTable, network2.compositionTable)
+        self.assertIs(network1.constraintCalculator,
+                      network2.constraintCalculator)
+
+    def test_tableCache(self):
+
+        with tempfile.TemporaryDirectory() as tmpDir:
+            for name in ('allen', 'rcc8'):
+                cacheFile = os.path.join(tmpDir, name + '.bin')
+                parsed = TransitiveConstraints(CALCULI[name], cacheFile)
+                cached = TransitiveConstraints(CALCULI[name], cacheFile)
+
+                self.assertTrue(os.path.exists(cacheFile))
+                self.assertEqual(dict(cached.basicConstraints),
+                                 dict(parsed.basicConstraints))
+                self.assertEqual(cached.relationNames,
+                                 parsed.relationNames)
+                self.assertEqual(list(cached.converse),
+                                 list(parsed.converse))
+                self.assertEqual(cached.identity, parsed.identity)
+
+            # a copy of the table with a newer mtime is parsed again
+            tableFile = os.path.join(tmpDir, 'table.txt')
+            with open(CALCULI['point']) as inobj, \
+                    open(tableFile, 'w') as outobj:
+                outobj.write(inobj.read())
+            shared = loadTransitiveConstraints(tableFile)
+            self.assertIs(loadTransitiveConstraints(tableFile), shared)
+            self.assertTrue(os.path.exists(tableFile + '.bin'))
+
+            # the sidecar also keeps the compiled composition table
+            table = getCompositionTable(shared)
+            cached = TransitiveConstraints(tableFile, tableFile + '.bin')
+            self.assertEqual(cached.cachedCompositionTable.low, table.low)
+            self.assertEqual(cached.cachedCompositionTable.high, table.high)
+
+            mtime = os.stat(tableFile).st_mtime_ns + 10 ** 9
+            os.utime(tableFile, ns=(mtime, mtime))
+            reloaded = loadTransitiveConstraints(tableFile)
+            self.assertIsNot(reloaded, shared)
+            self.assertFalse(TransitiveConstraints(tableFile).loadCache(
+                tableFile + '.bin.missing'))
+            self.assertEqual(dict(reloaded.basicConstraints),
+                             dict(shared.basicConstraints))
+
+            # corrupt or foreign cache files are parsed over
+            source = os.stat(tableFile)
+            for data in (b'garbage' * 100,
+                         TransitiveConstraints.CACHE_HEADER.pack(
+                             TransitiveConstraints.CACHE_MAGIC,
+                             TransitiveConstraints.CACHE_VERSION, 40,
+                             source.st_mtime_ns, source.st_size, 0)):
+                with open(tableFile + '.bin', 'wb') as outobj:
+                    outobj.write(data)
+                parsed = TransitiveConstraints(tableFile, tableFile + '.bin')
+                self.assertEqual(dict(parsed.basicConstraints),
+                                 dict(shared.basicConstraints))
+                network = ConstraintNetwork(
+                    transitive_table=CALCULI['rcc8'],
+                    cacheFile=tableFile + '.bin')
+                self.assertEqual(network.compositionTable.width, 8)
+
+
+class TestBatchClosure(unittest.TestCase):
+
+    def writeTlinks(self, tmpDir, name, lines):
+
+        path = os.path.join(tmpDir, name)
+        with open(path, 'w') as outobj:
+            outobj.write('\n'.join(lines) + '\n')
+        return path
+
+    def test_closeDocuments(self):
+
+        with tempfile.TemporaryDirectory() as tmpDir:
+            consistent = self.writeTlinks(
+                tmpDir, 'a.tlink', ['e1,e2,<', 'e2,e3,BEFORE'])
+            inconsistent = self.writeTlinks(
+                tmpDir, 'b.tlink', ['e1,e2,<', 'e2,e3,<', 'e3,e1,< m'])
+            broken = self.writeTlinks(tmpDir, 'c.tlink', ['e1,e2,xx'])
+
+            nodes, links = randomLinks(6, 8, 0)
+            network = ConstraintNetwork()
+            for link in links:
+                network.add(link)
+
+            results = list(batch_closure.closeDocuments(
+                [consistent, inconsistent, broken, network], maxWorkers=2))
+
+        statuses = dict((result.document, result.status)
+                        for result in results)
+        self.assertEqual(statuses, {consistent: 'consistent',
+                                    inconsistent: 'inconsistent',
+                                    broken: 'error',
+                                    3: 'consistent'})
+
+        closed = [result.network for result in results
+                  if result.document == 3][0]
+        self.assertTrue(network.isConsistent())
+        self.assertEqual(closedRelations(closed, closed.nodeList),
+                         closedRelations(network, network.nodeList))
+
+    def test_closeComponents(self):
+
+        clusters = [randomLinks(8, 12, seed) for seed in range(3)]
+        network = ConstraintNetwork()
+        serial = ConstraintNetwork()
+        for nodes, links in clusters:
+            for link in links:
+                network.add(link)
+                serial.add(link)
+
+        self.assertTrue(batch_closure.closeComponents(network, maxWorkers=2))
+        self.assertTrue(network.closed)
+        self.assertTrue(serial.isConsistent())
+        self.assertEqual(closedRelations(network, network.nodeList),
+                         closedRelations(serial, serial.nodeList))
+
+
+class TestClosureService(unittest.TestCase):
+
+    def test_closeStream(self):
+
+        pulled = []
+
+        async def documents():
+            for n in range(6):
+                pulled.append(n)
+                # the first document is much slower than the others
+                size = 50 if n == 0 else 5
+                nodes, links = randomLinks(size, 4 * size, n,
+                                           contradictions=n % 2)
+                yield ('doc{}'.format(n),
+                       [(link.source.nodeID, link.destination.nodeID,
+                         link.relation) for link in links])
+
+        async def collect():
+            results = []
+            async for result in closure_service.closeStream(
+                    documents(), maxWorkers=2, maxInFlight=2):
+                results.append((result, len(pulled)))
+            return results
+
+        results = asyncio.run(collect())
+
+        self.assertEqual(sorted(result.document for result, _ in results),
+                         ['doc{}'.format(n) for n in range(6)])
+        # documents are only taken while fewer than maxInFlight close
+        self.assertTrue(all(count <= n + 3
+                            for n, (_, count) in enumerate(results)))
+        statuses = dict((result.document, result.status)
+                        for result, _ in results)
+        self.assertEqual(statuses['doc0'], 'consistent')
+        self.assertEqual(statuses['doc1'], 'inconsistent')
+
+
+class TestTimeMLLoader(unittest.TestCase):
+
+    TIMEML = b"""<?xml version="1.0" ?>
+<TimeML>
+<DOCID>doc1</DOCID>
+<TEXT>
+<TIMEX3 tid="t1" type="DATE" value="1998-01-08">Thursday</TIMEX3>, the
+company <EVENT eid="e1" class="OCCURRENCE">said</EVENT> it had
+<EVENT eid="e2" class="OCCURRENCE">sold</EVENT> the unit.
+</TEXT>
+<MAKEINSTANCE eventID="e1" eiid="ei1" tense="PAST"/>
+<MAKEINSTANCE eventID="e2" eiid="ei2" tense="PAST"/>
+<TLINK lid="l1" relType="IS_INCLUDED" eventInstanceID="ei1"
+       relatedToTime="t1"/>
+<TLINK lid="l2" relType="AFTER" eventInstanceID="ei1"
+       relatedToEventInstance="ei2"/>
+<TLINK lid="l3" relType="OVERLAP" eventInstanceID="ei2"
+       relatedToTime="t1"/>
+</TimeML>
+"""
+
+    def test_iterTimeML(self):
+
+        with tempfile.TemporaryDirectory() as tmpDir:
+            path = os.path.join(tmpDir, 'doc1.tml')
+            with open(path, 'wb') as outobj:
+                outobj.write(self.TIMEML)
+            annotations = list(timeml_loader.iterTimeML(path))
+
+        self.assertEqual(annotations[:3], [('TIMEX3', 't1'), ('EVENT', 'e1'),
+                                           ('EVENT', 'e2')])
+        self.assertIn(('MAKEINSTANCE', 'ei2', 'e2'), annotations)
+        self.assertIn(('TLINK', 'l2', 'ei1', 'ei2', 'AFTER'), annotations)
+
+        # processed elements do not stay attached under TEXT
+        document = b'<TimeML><TEXT>' + b''.join(
+            b'<s>w <EVENT eid="e%d">x</EVENT> y</s>' % n
+            for n in range(1000)) + b'</TEXT></TimeML>'
+        for annotation in timeml_loader.iterTimeML(io.BytesIO(document)):
+            if annotation == ('EVENT', 'e999'):
+                elements = sum(isinstance(obj, ET.Element)
+                               for obj in gc.get_objects())
+        self.assertLess(elements, 100)
+
+    def test_loadTimeML(self):
+
+        with tempfile.TemporaryDirectory() as tmpDir:
+            path = os.path.join(tmpDir, 'doc1.tml')
+            with open(path, 'wb') as outobj:
+                outobj.write(self.TIMEML)
+
+            network = timeml_loader.loadTimeML(path, storage='sparse')
+            [(loadedPath, loaded)] = list(
+                timeml_loader.iterTimeMLDirectory(tmpDir))
+            result = batch_closure.closeDocument(path, path)
+
+        self.assertEqual(loadedPath, path)
+        self.assertEqual(len(loaded.nodes), 3)
+        self.assertEqual(result.status, 'consistent')
+
+        nodes = dict((node.nodeID, node) for node in network.nodes)
+        self.assertEqual(sorted(nodes), ['e1', 'e2', 't1'])
+        self.assertTrue(network.isConsistent())
+        self.assertEqual(network.networkDict[nodes['e2']][nodes['e1']]
+                         .relation, TemporalRelation.BEFORE)
+        self.assertEqual(network.networkDict[nodes['e2']][nodes['t1']]
+                         .relation,
+                         TemporalRelation.BEFORE | TemporalRelation.OVERLAP |
+                         TemporalRelation.MEETS | TemporalRelation.DURING |
+                         TemporalRelation.STARTS)
+
+
+class TestNetworkIO(unittest.TestCase):
+
+    def test_saveAndMap(self):
+
+        nodes, links = randomLinks(12, 20, 3)
+        network = ConstraintNetwork(storage='sparse')
+        for link in links:
+            network.add(link)
+        self.assertTrue(network.isConsistent())
+
+        with tempfile.TemporaryDirectory() as tmpDir:
+            for layout in (network_io.DENSE, network_io.SPARSE):
+                path = os.path.join(tmpDir, 'network.bin')
+                network_io.saveNetwork(network, path, layout)
+
+                with network_io.MappedNetwork(path) as mapped:
+                    self.assertEqual(mapped.layout, layout)
+                    self.assertTrue(mapped.closed)
+                    for nodeI in network.nodes:
+                        self.assertEqual(
+                            mapped.relation(nodeI.nodeID, nodeI.nodeID),
+                            TemporalRelation.EQUAL)
+                        for nodeJ in network.nodes:
+                            if nodeI is nodeJ:
+                                continue
+                            relation = network.networkDict[
+                                nodeI][nodeJ].relation
+                            self.assertEqual(
+                                mapped.relation(nodeI.nodeID, nodeJ.nodeID),
+                                relation)
+                            self.assertEqual(
+                                mapped.networkDict[nodeI][nodeJ].relation,
+                                relation)
+
+                loaded = network_io.loadNetwork(path, storage='matrix')
+                self.assertTrue(loaded.closed)
+                loadedNodes = dict((node.nodeID, node)
+                                   for node in loaded.nodes)
+                self.assertEqual(
+                    closedRelations(loaded, [loadedNodes[node.nodeID]
+                                             for node in nodes
+                                             if node in network.nodes]),
+                    closedRelations(network, nodes))
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.transitive_table = 'data/transitive_table.txt'
+
+    def test_intervalRelation(self):
+
+        self.assertEqual(TemporalRelation.intervalRelation((0, 2), (1, 3)),
+                         TemporalRelation.OVERLAP)
+        self.assertEqual(TemporalRelation.intervalRelation((1, 2), (0, 2)),
+                         TemporalRelation.FINISHES)
+        self.assertEqual(TemporalRelation.intervalRelation((0, 1), (1, 2)),
+                         TemporalRelation.MEETS)
+
+    def test_runBenchmarks(self):
+
+        records = list(benchmark.runBenchmarks(
+            [6, 12], density=0.5, storages=('links', 'sparse'),
+            compositions=100, transitive_table=self.transitive_table))
+        names = [record['benchmark'] for record in records]
+
+        self.assertEqual(names[:3], ['loadTransitiveConstraints',
+                                     'buildCompositionTable',
+                                     'calConstraint'])
+        closures = [record for record in records
+                    if record['benchmark'] == 'isConsistent']
+        self.assertEqual(len(closures), 4)
+        self.assertTrue(all(record['consistent'] for record in closures))
+        self.assertTrue(all(record['peakBytes'] > 0 for record in closures))
+        self.assertIn('isConsistent/sparse/python',
+                      [record['series'] for record in records
+                       if record['benchmark'] == 'scaling'])
+
+
+class TestSolver(unittest.TestCase):
+
+    def buildNetwork(self, links):
+
+        network = ConstraintNetwork()
+        for link in links:
+            network.add(link)
+        return network
+
+    def test_relationSubclass(self):
+
+        # the sizes given by Nebel and Buerckert, with the empty relation
+        self.assertEqual(sum(relationSubclass('convex')), 83)
+        self.assertEqual(sum(relationSubclass('pointisable')), 188)
+        self.assertEqual(sum(relationSubclass('ord-horn')), 868)
+        self.assertTrue(relationSubclass('ord-horn')[
+            TemporalRelation.BEFORE | TemporalRelation.MEETS])
+        self.assertFalse(relationSubclass('ord-horn')[
+            TemporalRelation.BEFORE | TemporalRelation.AFTER])
+        self.assertRaises(ValueError, relationSubclass, 'rcc8')
+
+    def test_isConsistent(self):
+
+        rand = random.Random(1)
+        basicRels = [1 << p for p in range(13)]
+        for seed in range(40):
+            nodes = [Node(i) for i in range(4)]
+            links = []
+            for _ in range(6):
+                i, j = rand.sample(range(4), 2)
+                links.append(Link(nodes[i], nodes[j], set(
+                    rand.sample(basicRels, rand.randint(1, 7)))))
+
+            expected = Solver(self.buildNetwork(links)).countScenarios(
+                limit=1) > 0
+            for heuristic in Solver.HEURISTICS:
+                network = self.buildNetwork(links)
+                self.assertEqual(Solver(network, heuristic=heuristic)
+                                 .isConsistent(), expected)
+
+            scenario = Solver(self.buildNetwork(links)).scenario()
+            self.assertEqual(scenario is not None, expected)
+            if scenario is None:
+                continue
+            for link in links:
+                relation = scenario.get((link.source, link.destination))
+                if relation is None:
+                    relation = TemporalRelation.INVERSE[
+                        scenario[(link.destination, link.source)]]
+                self.assertTrue(relation & link.relation)
+
+    def test_countScenarios(self):
+
+        nodes = [Node(i) for i in range(3)]
+        before = set([TemporalRelation.BEFORE])
+        network = self.buildNetwork([Link(nodes[0], nodes[1], before),
+                                     Link(nodes[0], nodes[2], before)])
+        solver = Solver(network)
+
+        self.assertEqual(solver.countScenarios(), 13)
+        self.assertEqual(solver.countScenarios(limit=5), 5)
+        self.assertEqual(network.networkDict[nodes[1]][nodes[2]].relation,
+                         TemporalRelation.ALL)
+
+        self.assertTrue(solver.minimalNetwork())
+        self.assertEqual(network.networkDict[nodes[1]][nodes[2]].relation,
+                         TemporalRelation.ALL)
+
+        network.add(Link(nodes[1], nodes[2], set(
+            [TemporalRelation.BEFORE, TemporalRelation.AFTER])))
+        self.assertTrue(solver.minimalNetwork())
+        self.assertEqual(solver.countScenarios(), 2)
+
+        # queries see the relations narrowed by minimalNetwork
+        nodes, links = randomLinks(6, 9, 2, maxWidth=7)
+        network = self.buildNetwork(links)
+        pairs = [(nodeA, nodeB) for nodeA in nodes for nodeB in nodes
+                 if nodeA is not nodeB and nodeA in network.nodes
+                 and nodeB in network.nodes]
+        network.relations(pairs)
+        self.assertTrue(Solver(network).minimalNetwork())
+        self.assertEqual(network.relations(pairs),
+                         [network.networkDict[nodeA][nodeB].relation
+                          for nodeA, nodeB in pairs])
+
+
+class TestCalculi(unittest.TestCase):
+
+    def test_tables(self):
+
+        for name, tableFile in sorted(CALCULI.items()):
+            calculus = TransitiveConstraints(tableFile)
+            table = getCompositionTable(calculus)
+            converse = calculus.converse
+            basicRels = [1 << p for p in range(calculus.width)]
+
+            self.assertEqual(calculus.universal, (1 << calculus.width) - 1)
+            for rel1 in basicRels:
+                self.assertEqual(converse[converse[rel1]], rel1)
+                self.assertEqual(table.compose(calculus.identity, rel1),
+                                 rel1)
+                for rel2 in basicRels:
+                    # (r1 o r2)~ = r2~ o r1~
+                    self.assertEqual(
+                        converse[table.compose(rel1, rel2)],
+                        table.compose(converse[rel2], converse[rel1]),
+                        '{} {} {}'.format(name, rel1, rel2))
+
+        self.assertTrue(TransitiveConstraints(CALCULI['allen']).allen)
+        self.assertEqual(TransitiveConstraints(CALCULI['rcc8'])
+                         .relationFromString('TPP, NTPP'), 8 | 16)
+
+    def test_rcc8Network(self):
+
+        rcc8 = TransitiveConstraints(CALCULI['rcc8'])
+        regions = [Node(name) for name in ('room', 'floor', 'building')]
+
+        for storage in ('links', 'matrix', 'sparse'):
+            network = ConstraintNetwork(constraints=rcc8, storage=storage)
+            for nodeI, nodeJ in zip(regions, regions[1:]):
+                link = Link(nodeI, nodeJ)
+                link.relation = rcc8.relationFromString('NTPP')
+                network.add(link)
+
+            self.assertEqual(network.relation(regions[0], regions[2]),
+                             rcc8.relationFromString('NTPP'))
+            self.assertEqual(network.relation(regions[2], regions[0]),
+                             rcc8.relationFromString('NTPPi'))
+
+            link = Link(regions[2], regions[0])
+            link.relation = rcc8.relationFromString('DC EC')
+            network.add(link)
+            self.assertFalse(network.isConsistent())
+
+    def test_pointNetwork(self):
+
+        network = ConstraintNetwork(calculus='point', storage='matrix')
+        points = [Node(i) for i in range(3)]
+        less = network.constraintCalculator.relationFromString('<')
+        for nodeI, nodeJ in zip(points, points[1:]):
+            link = Link(nodeI, nodeJ)
+            link.relation = less
+            network.add(link)
+
+        self.assertTrue(network.isConsistent())
+        self.assertEqual(network.relation(points[0], points[2]), less)
+        network.add(Link(points[2], points[0], set([less])))
+        self.assertFalse(network.isConsistent())
+        self.assertRaises(ValueError, ConstraintNetwork, calculus='allen2')
+
+    def test_closeReduced(self):
+
+        projection = timeMLProjection()
+        self.assertEqual(projection.project(TemporalRelation.MEETS |
+                                            TemporalRelation.STARTS),
+                         projection.coarse.relationFromString(
+                             'BEFORE IS_INCLUDED'))
+        self.assertEqual(projection.lift(projection.coarse.universal),
+                         TemporalRelation.ALL)
+
+        for seed in range(10):
+            nodes, links = randomLinks(8, 14, seed, contradictions=seed % 3)
+            approximate = ConstraintNetwork()
+            exact = ConstraintNetwork()
+            for link in links:
+                approximate.add(link)
+                exact.add(link)
+
+            reduced = approximate.closeReduced()
+            consistent = exact.isConsistent()
+            if not reduced:
+                self.assertFalse(consistent)
+                continue
+            # lifting only removes relations no solution uses
+            self.assertEqual(approximate.isConsistent(), consistent)
+            if consistent:
+                self.assertEqual(closedRelations(approximate, nodes),
+                                 closedRelations(exact, nodes))
+
+
 if __name__ == "__main__":
 
     unittest.main()
@@ -0,0 +1,113 @@
+import os
+import logging
+import xml.etree.ElementTree as ET
+
+from make_temp_rel_const_table import (ConstraintNetwork, Link,
+                                       NodeRegistry, TimeMLRelation)
+
+# create logger
+module_logger = logging.getLogger('timeml_loader')
+
+TIMEML_EXTENSIONS = ('.tml', '.xml')
+
+
+def _localName(tag):
+
+    return tag.rsplit('}', 1)[-1]
+
+
+def iterTimeML(source):
+    """
+    Stream the annotations of a TimeML file (a path or a binary file
+    object) with iterparse and yield
+
+        ('EVENT', eid), ('TIMEX3', tid),
+        ('MAKEINSTANCE', eiid, eid),
+        ('TLINK', lid, source id, target id, relType)
+
+    in document order. Every element is cleared and detached from its
+    parent when it ends, so memory stays bounded by the elements that
+    are open at a time.
+    """
+
+    parents = []
+
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+
+        if event == 'start':
+            parents.append(elem)
+            continue
+
+        parents.pop()
+        tag = _localName(elem.tag)
+        attrib = elem.attrib
+
+        if tag == 'EVENT':
+            yield ('EVENT', attrib['eid'])
+        elif tag == 'TIMEX3':
+            yield ('TIMEX3', attrib['tid'])
+        elif tag == 'MAKEINSTANCE':
+            yield ('MAKEINSTANCE', attrib['eiid'], attrib['eventID'])
+        elif tag == 'TLINK':
+            yield ('TLINK', attrib.get('lid'),
+                   attrib.get('eventInstanceID') or attrib.get('timeID'),
+                   attrib.get('relatedToEventInstance') or
+                   attrib.get('relatedToTime'),
+                   attrib.get('relType'))
+
+        elem.clear()
+        if parents:
+            # the earlier children are gone, so this is the only one
+            parents[-1].remove(elem)
+
+
+def loadTimeML(source, network=None, **networkArgs):
+    """
+    Build a ConstraintNetwork from the TLINKs of a TimeML file.
+
+    Event instances are mapped to the Node of their EVENT, so that all
+    TLINKs of an event share one node, and TIMEX3s get a Node per tid.
+    relTypes are translated with TimeMLRelation.TIMEML_TO_ALLEN; links
+    with other relTypes are skipped. networkArgs are passed to
+    ConstraintNetwork when no network is given.
+    """
+
+    if network is None:
+        network = ConstraintNetwork(**networkArgs)
+
+    registry = NodeRegistry()
+    instances = {}
+
+    def getNode(nodeID):
+        return registry.get(instances.get(nodeID, nodeID))
+
+    for annotation in iterTimeML(source):
+
+        if annotation[0] == 'MAKEINSTANCE':
+            instances[annotation[1]] = annotation[2]
+
+        elif annotation[0] == 'TLINK':
+            lid, sourceID, targetID, relType = annotation[1:]
+            relation = TimeMLRelation.TIMEML_TO_ALLEN.get(relType)
+
+            if relation is None or sourceID is None or targetID is None:
+                module_logger.warning(
+                    'Skipping TLINK {} with relType {}'.format(lid, relType))
+                continue
+
+            network.add(Link(getNode(sourceID), getNode(targetID),
+                             set([relation])))
+
+    return network
+
+
+def iterTimeMLDirectory(directory, **networkArgs):
+    """
+    Yield (path, ConstraintNetwork) for every TimeML file of a directory,
+    one document at a time
+    """
+
+    for fileName in sorted(os.listdir(directory)):
+        if fileName.lower().endswith(TIMEML_EXTENSIONS):
+            path = os.path.join(directory, fileName)
+            yield path, loadTimeML(path, **networkArgs)